@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+'''zhcal 基準測試
+
+對每個公開的轉換和輸出函數測量：
+    latency_us   單次調用耗時（微秒，多輪取最小值）
+    throughput   覆蓋 1901-2049 全範圍時每秒處理的項數
+    peak_kib     全範圍運行時 tracemalloc 記錄的內存峰值（KiB）
+
+結果以 JSON 輸出，可用 --baseline 與之前保存的結果比較，
+任一指標退化超過 --threshold 時以狀態碼 1 退出。
+
+--threads N 另外測量 1 至 N 個線程同時轉換全範圍日期時的總吞吐量，
+用於確認在無 GIL 的 CPython 上能否隨線程數擴展。
+
+只調用最初版本的 zhcal 已有的公開函數（較新的函數先檢查是否存在），
+因此可以把本文件複製到舊版 zhcal.py 所在的目錄運行，得到比較用的基準
+結果（腳本所在目錄優先於 PYTHONPATH）。
+'''
+
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import timeit
+import tracemalloc
+
+import zhcal
+
+
+# 越小越好的指標
+LOWER_IS_BETTER = ['latency_us', 'peak_kib']
+# 越大越好的指標
+HIGHER_IS_BETTER = ['throughput']
+
+
+FIRST_DATE = datetime.date(1901, 1, 1)
+DAY_COUNT = (datetime.date(2050, 1, 1) - FIRST_DATE).days
+
+
+def all_dates():
+    return [FIRST_DATE + datetime.timedelta(i) for i in range(0, DAY_COUNT)]
+
+
+def all_lunar_dates():
+    result = []
+    # 正月初一以前屬於上一農曆年，1900 年的日期不計入
+    lunar_year = 1900
+    for year in range(1901, 2050):
+        for day in zhcal.build_calendar(year):
+            if (day['lunar_month'], day['lunar_date'],
+                    day['is_leap_month']) == (1, 1, False):
+                lunar_year = year
+            if lunar_year >= 1901:
+                result.append((lunar_year, day['lunar_month'],
+                               day['lunar_date'], day['is_leap_month']))
+    return result
+
+
+def all_datetimes():
+    return [
+        datetime.datetime(date.year, date.month, date.day,
+                          i * 7 % 24, tzinfo=zhcal.tz)
+        for i, date in enumerate(all_dates())
+    ]
+
+
+def all_months():
+    return [(year, month) for year in range(1901, 2050)
+            for month in range(1, 13)]
+
+
+def run_print_calendar(year, month):
+    with open(os.devnull, 'w') as null:
+        with contextlib.redirect_stdout(null):
+            zhcal.print_calendar(year, month, 0)
+
+
+def run_print_calendar_all(months):
+    with open(os.devnull, 'w') as null:
+        with contextlib.redirect_stdout(null):
+            for year, month in months:
+                zhcal.print_calendar(year, month, 0)
+
+
+# name: (single call, full-range input, full-range run)
+BENCHMARKS = {
+    'gregorian_to_zh': (
+        lambda: zhcal.gregorian_to_zh(datetime.date(2015, 10, 5)),
+        all_dates,
+        lambda dates: [zhcal.gregorian_to_zh(date) for date in dates]
+    ),
+    'zh_to_gregorian': (
+        lambda: zhcal.zh_to_gregorian(2015, 8, 23, False),
+        all_lunar_dates,
+        lambda items: [zhcal.zh_to_gregorian(*item) for item in items]
+    ),
+    'get_festivals_date': (
+        lambda: zhcal.get_festivals_date(2015),
+        lambda: list(range(1901, 2050)),
+        lambda years: [zhcal.get_festivals_date(year) for year in years]
+    ),
+    'get_year_cycle_index': (
+        lambda: zhcal.get_year_cycle_index(datetime.date(2015, 10, 5)),
+        all_dates,
+        lambda dates: [zhcal.get_year_cycle_index(date) for date in dates]
+    ),
+    'get_month_cycle_index': (
+        lambda: zhcal.get_month_cycle_index(datetime.date(2015, 10, 5)),
+        all_dates,
+        lambda dates: [zhcal.get_month_cycle_index(date) for date in dates]
+    ),
+    'get_day_cycle_index': (
+        lambda: zhcal.get_day_cycle_index(datetime.date(2015, 10, 5)),
+        all_dates,
+        lambda dates: [zhcal.get_day_cycle_index(date) for date in dates]
+    ),
+    'get_hour_cycle_index': (
+        lambda: zhcal.get_hour_cycle_index(
+            datetime.datetime(2015, 10, 5, 20, 46, tzinfo=zhcal.tz)
+        ),
+        all_datetimes,
+        lambda items: [zhcal.get_hour_cycle_index(item) for item in items]
+    ),
+    'print_calendar': (
+        lambda: run_print_calendar(2015, 10),
+        all_months,
+        run_print_calendar_all
+    )
+}
+
+
+def measure(name, repeat):
+    '''運行一項基準測試
+
+    @param str name
+    @param int repeat 單次調用耗時的測量輪數
+    @return dict { latency_us, throughput, peak_kib, range_items }
+    '''
+    single, prepare, run = BENCHMARKS[name]
+    # 預熱：載入查詢表及緩存
+    single()
+
+    timer = timeit.Timer(single)
+    number, _ = timer.autorange()
+    latency = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    items = prepare()
+    start = time.perf_counter()
+    run(items)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    run(items)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'latency_us': latency * 1e6,
+        'throughput': len(items) / elapsed,
+        'peak_kib': peak / 1024,
+        'range_items': len(items)
+    }
+
+
+def measure_threads(count, repeat):
+    '''多線程吞吐量：每個線程各自轉換全範圍日期
+
+    @param int count 線程數
+    @param int repeat 輪數，取最快一輪
+    @return dict { threads, throughput }
+    '''
+    dates = all_dates()
+    # 預熱：載入查詢表
+    zhcal.gregorian_to_zh(dates[0])
+    # 舊版沒有批量四柱，只測農曆轉換
+    pillars_many = getattr(zhcal, 'get_four_pillars_many', None)
+    first = zhcal.date2ts(FIRST_DATE) - 8 * 3600
+    timestamps = range(first, first + len(dates) * 86400, 86400)
+    if pillars_many:
+        pillars_many(timestamps[:1])
+
+    def work():
+        barrier.wait()
+        for date in dates:
+            zhcal.gregorian_to_zh(date)
+        if pillars_many:
+            pillars_many(timestamps)
+
+    best = None
+    for _ in range(0, repeat):
+        barrier = threading.Barrier(count + 1)
+        threads = [threading.Thread(target=work) for _ in range(0, count)]
+        for thread in threads:
+            thread.start()
+        start = time.perf_counter()
+        barrier.wait()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return {
+        'threads': count,
+        'throughput': len(dates) * (2 if pillars_many else 1) * count / best
+    }
+
+
+def compare(results, baseline, threshold):
+    '''與基準結果比較
+
+    @param dict results
+    @param dict baseline
+    @param float threshold 允許的相對退化，如 0.2 表示 20%
+    @return list<str> 退化說明
+    '''
+    regressions = []
+    for name, metrics in results['benchmarks'].items():
+        old = baseline.get('benchmarks', {}).get(name)
+        if old is None:
+            continue
+        for key in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            if not old.get(key) or key not in metrics:
+                continue
+            if key in LOWER_IS_BETTER:
+                change = metrics[key] / old[key] - 1
+            else:
+                change = old[key] / metrics[key] - 1
+            if change > threshold:
+                regressions.append('{0}.{1}: {2:.4g} -> {3:.4g} ({4:+.1%})'
+                                   .format(name, key, old[key], metrics[key],
+                                           change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='zhcal benchmarks')
+    parser.add_argument('names', nargs='*', metavar='name',
+                        help='Benchmarks to run (default: all): '
+                             + ', '.join(BENCHMARKS))
+    parser.add_argument('-o', '--output', help='Write results to this file')
+    parser.add_argument('-b', '--baseline',
+                        help='Compare against a stored result file')
+    parser.add_argument('-t', '--threshold', type=float, default=0.2,
+                        help='Allowed relative regression (default: 0.2)')
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help='Rounds of single-call timing (default: 5)')
+    parser.add_argument('--threads', type=int, default=0, metavar='N',
+                        help='Also measure throughput with 1 to N threads')
+    args = parser.parse_args()
+
+    names = args.names or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark: ' + name)
+
+    results = {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'gil': getattr(sys, '_is_gil_enabled', lambda: True)(),
+        'time': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'benchmarks': {}
+    }
+    for name in names:
+        metrics = measure(name, args.repeat)
+        results['benchmarks'][name] = metrics
+        print('{0:<24}{1:>12.2f} us{2:>14.0f} /s{3:>12.1f} KiB'.format(
+            name, metrics['latency_us'], metrics['throughput'],
+            metrics['peak_kib']
+        ), file=sys.stderr)
+
+    if args.threads:
+        results['threads'] = []
+        for count in range(1, args.threads + 1):
+            metrics = measure_threads(count, min(args.repeat, 3))
+            metrics['speedup'] = (metrics['throughput']
+                                  / results['threads'][0]['throughput']
+                                  if results['threads'] else 1.0)
+            results['threads'].append(metrics)
+            print('{0:<24}{1:>14.0f} /s{2:>10.2f}x'.format(
+                'threads={0}'.format(count), metrics['throughput'],
+                metrics['speedup']
+            ), file=sys.stderr)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print('regression: ' + regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,361 @@
+import asyncio
+import datetime
+import pickle
+import threading
+import time
+
+import pytest
+
+import zhcal
+
+
+def test_verify():
+    # 各查詢表和快速路徑與凍結的參照算法逐日比較
+    for field, record in zhcal.verify().items():
+        assert record['checked'] > 0, field
+        assert record['mismatches'] == 0, (field, record['first'])
+
+
+# 閏月大小
+
+def test_leap_month_day_count():
+    # 2017 閏六月大，2020 閏四月小，2023 閏二月小
+    assert zhcal.get_month_day_count(0, 2017) == 30
+    assert zhcal.get_month_day_count(0, 2020) == 29
+    assert zhcal.get_month_day_count(0, 2023) == 29
+    for year in range(1901, 2049):
+        if zhcal.get_leap_month(year):
+            assert (zhcal.get_month_day_count(0, year)
+                    == zhcal.reference_get_month_day_count(0, year))
+
+
+def test_month_lengths_match_initial_days():
+    # 由 1901 年起逐月累加得到的每年元旦農曆日期，須與
+    # LUNAR_DATE_OF_INITIAL_DAYS 中獨立記錄的一致
+    for year in range(1902, 2050):
+        code = zhcal.LUNAR_DATE_OF_INITIAL_DAYS[year-1900]
+        month, is_leap_month = [(11, False), (12, False), (11, True)][
+            code >> 6
+        ]
+        zh = zhcal.gregorian_to_zh(datetime.date(year, 1, 1))
+        assert (zh['lunar_month'], zh['lunar_date'], zh['is_leap_month']) \
+            == (month, code & 0x3f, is_leap_month), year
+
+
+def test_leap_month_segments():
+    segments = zhcal.lunar_segments(datetime.date(2020, 5, 23),
+                                    datetime.date(2020, 5, 23))
+    assert segments == [{
+        'lunar_year': 2020,
+        'lunar_month': 4,
+        'is_leap_month': True,
+        'start': datetime.date(2020, 5, 23),
+        'end': datetime.date(2020, 6, 20),
+        'length': 29
+    }]
+
+
+# 範圍檢查
+
+@pytest.mark.parametrize('date', [
+    datetime.date(1900, 5, 1),
+    datetime.date(1900, 12, 31),
+    datetime.date(2050, 1, 1)
+])
+@pytest.mark.parametrize('function', [
+    zhcal.get_year_cycle_index,
+    zhcal.get_month_cycle_index,
+    zhcal.get_solar_term_period,
+    zhcal.get_next_solar_term,
+    zhcal.get_prev_solar_term,
+    zhcal.gregorian_to_zh,
+    zhcal.decode_lunar_day,
+    zhcal.LunarDate.from_gregorian
+])
+def test_out_of_range_date(function, date):
+    with pytest.raises(NotImplementedError):
+        function(date)
+
+
+def test_pillars_at_range_edges():
+    first = datetime.date(1901, 1, 1)
+    last = datetime.date(2049, 12, 31)
+    for date in [first, last]:
+        ordinal = zhcal.date2ordinal(date)
+        pillars = zhcal.get_pillars_by_ordinal(ordinal, 0)
+        assert zhcal.get_year_cycle_index(date) == pillars[0]
+        assert zhcal.get_month_cycle_index(date) == pillars[1]
+
+
+def test_solar_term_date_index():
+    assert zhcal.get_solar_term_date(2, 2015) == datetime.date(2015, 2, 4)
+    for index in [-1, 24]:
+        with pytest.raises(ValueError):
+            zhcal.get_solar_term_date(index, 2015)
+    with pytest.raises(NotImplementedError):
+        zhcal.get_solar_term_date(0, 2050)
+
+
+def test_lunar_segments_reversed_range():
+    assert zhcal.lunar_segments(datetime.date(2020, 5, 10),
+                                datetime.date(2020, 5, 1)) == []
+    assert len(zhcal.lunar_segments(datetime.date(2020, 5, 10),
+                                    datetime.date(2020, 5, 10))) == 1
+    with pytest.raises(NotImplementedError):
+        zhcal.lunar_segments(datetime.date(2049, 12, 1),
+                             datetime.date(2050, 1, 1))
+
+
+# 單日解碼（info、now）
+
+def test_decode_matches_tables():
+    for ordinal in range(0, zhcal.DAY_COUNT, 7):
+        date = zhcal.ordinal2date(ordinal)
+        assert zhcal.decode_lunar_day(date) == (
+            zhcal.DAY_INDEX['lunar_year'][ordinal],
+            zhcal.DAY_INDEX['lunar_month'][ordinal],
+            zhcal.DAY_INDEX['lunar_date'][ordinal],
+            bool(zhcal.DAY_INDEX['is_leap_month'][ordinal])
+        )
+        hour = ordinal % 24
+        assert zhcal.decode_four_pillars(date, hour) \
+            == zhcal.get_pillars_by_ordinal(ordinal, hour)
+
+
+# LunarDate
+
+def test_lunar_date():
+    date = zhcal.LunarDate(2020, 4, 1, True)
+    assert date.to_gregorian() == datetime.date(2020, 5, 23)
+    assert (date.year, date.month, date.day, date.is_leap_month) \
+        == (2020, 4, 1, True)
+    assert repr(date) == 'LunarDate(2020, 4, 1, True)'
+    assert date + datetime.timedelta(29) == zhcal.LunarDate(2020, 5, 1)
+    assert zhcal.LunarDate(2020, 5, 1) - date == datetime.timedelta(29)
+    assert date < zhcal.LunarDate(2020, 5, 1)
+    assert pickle.loads(pickle.dumps(date)) == date
+    assert hash(date) == hash(zhcal.LunarDate.from_ordinal(date.ordinal))
+    # 四月大，閏四月小：月末取閏四月廿九
+    assert zhcal.LunarDate(2020, 4, 30).add_months(1) \
+        == zhcal.LunarDate(2020, 4, 29, True)
+    with pytest.raises(AttributeError):
+        date.ordinal = 0
+    with pytest.raises(ValueError):
+        zhcal.LunarDate(2021, 4, 1, True)
+
+
+# 四柱查找
+
+def test_find_pillars():
+    start = datetime.date(2000, 1, 1)
+    end = datetime.date(2010, 12, 31)
+    found = list(zhcal.find_pillars(start, end, year='庚辰', day='甲子'))
+    expected = []
+    for ordinal in range(zhcal.date2ordinal(start),
+                         zhcal.date2ordinal(end) + 1):
+        pillars = zhcal.get_pillars_by_ordinal(ordinal, 0)
+        if zhcal.CYCLE_60[pillars[0]] == '庚辰' \
+                and zhcal.CYCLE_60[pillars[2]] == '甲子':
+            expected.append(zhcal.ordinal2date(ordinal))
+    assert found == expected
+    assert found
+
+
+# convert
+
+@pytest.mark.parametrize('text, has_time', [
+    ('2020-01-01', False),
+    ('2020-1-1', False),
+    ('20200101', False),
+    ('2020-01-01 08:00', True),
+    ('2020-1-1 8:00', True),
+    ('2020-01-01T08:00+08:00', True),
+    ('  2020-01-01  ', False)
+])
+def test_convert_record(text, has_time):
+    record = zhcal.convert_record(text)
+    assert record['input'] == text.strip()
+    assert (record['lunar_month'], record['lunar_date']) == (12, 7)
+    assert record['day_pillar'] == '癸卯'
+    assert record['hour_pillar'] == ('丙辰' if has_time else None)
+
+
+@pytest.mark.parametrize('text', ['x', '2020-01', '2020-13-01',
+                                  '2020-01-01 25:00'])
+def test_convert_record_invalid(text):
+    with pytest.raises(ValueError):
+        zhcal.convert_record(text)
+
+
+# LRUCache
+
+def test_lru_cache_eviction():
+    cache = zhcal.LRUCache(3)
+    for key in [1, 2, 3]:
+        cache.get(key, str)
+    cache.get(1, str)
+    cache.get(4, str)
+    assert sorted(cache.data) == [1, 3, 4]
+    assert cache.info() == {'hits': 1, 'misses': 4, 'maxsize': 3,
+                            'currsize': 3}
+    cache.resize(0)
+    assert cache.get(5, str) == '5'
+    assert not cache.data
+
+
+def test_lru_cache_builds_each_key_once():
+    cache = zhcal.LRUCache(8)
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def build(key):
+        calls.append(key)
+        time.sleep(0.01)
+        return key * 2
+
+    def work():
+        barrier.wait()
+        for key in range(4):
+            assert cache.get(key, build) == key * 2
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(calls) == [0, 1, 2, 3]
+
+
+def test_lru_cache_clear_drops_running_build():
+    cache = zhcal.LRUCache(8)
+
+    def build(key):
+        cache.clear()
+        return key
+
+    assert cache.get(1, build) == 1
+    assert not cache.data
+
+
+# 節日
+
+def test_register_festival_visible_to_readers():
+    date = datetime.date(2024, 4, 12)
+    zhcal.month_grid(2024, 4)
+    zhcal.register_festival('測試節', 3, 4)
+    try:
+        assert '測試節' in [festival['name'] for festival
+                           in zhcal.festivals_between(date, date)]
+        cells = [cell for week in zhcal.month_grid(2024, 4) for cell in week
+                 if cell is not None and cell['date'] == date]
+        assert cells[0]['festival'] == '測試節'
+    finally:
+        del zhcal.FESTIVALS[-1]
+        zhcal.FESTIVAL_INDEX.clear()
+        zhcal.FESTIVAL_INDEX.loaded = False
+        zhcal.FESTIVAL_COLUMNS = None
+        zhcal.GRID_CACHE.clear()
+
+
+# 數據文件
+
+def test_data_file_round_trip(tmp_path):
+    path = str(tmp_path / 'zhcal.dat')
+    zhcal.write_data_file(path)
+    loaded = zhcal.load_data_file(path)
+    assert loaded is not None
+    data_mmap, sections = loaded
+    try:
+        assert list(sections['day.lunar_month']) \
+            == list(zhcal.DAY_INDEX['lunar_month'])
+        assert list(sections['solar_term.ordinal']) \
+            == list(zhcal.SOLAR_TERM_TABLE['ordinal'])
+    finally:
+        sections.clear()
+        data_mmap.close()
+    with open(path, 'r+b') as f:
+        f.seek(-1, 2)
+        last = f.read(1)
+        f.seek(-1, 2)
+        f.write(bytes([last[0] ^ 0xff]))
+    assert zhcal.load_data_file(path) is None
+
+
+# HTTP 服務
+
+def request(method, target, headers=None, body=b''):
+    import json
+    status, headers, payload = zhcal.handle_request(
+        method, target, headers or {}, body, zhcal.ServeMetrics()
+    )
+    if headers.get('Content-Type', '').startswith('application/json') \
+            and payload:
+        return status, json.loads(payload.decode('utf-8'))
+    return status, payload
+
+
+def test_handle_request():
+    status, result = request('GET', '/gregorian_to_zh?date=2020-05-23')
+    assert status == 200
+    assert (result['lunar_year'], result['lunar_month'],
+            result['lunar_date'], result['is_leap_month']) \
+        == (2020, 4, 1, True)
+    assert request('GET', '/nowhere')[0] == 404
+    assert request('POST', '/pillars')[0] == 405
+    assert request('GET', '/gregorian_to_zh?date=x')[0] == 400
+    assert request('GET', '/gregorian_to_zh?date=2050-01-01')[0] == 400
+
+
+@pytest.mark.parametrize('value, status', [
+    ('abc', 400),
+    ('-1', 400),
+    ('1e3', 400),
+    (str(zhcal.SERVE_MAX_BODY + 1), 413)
+])
+def test_content_length_errors(value, status):
+    with pytest.raises(zhcal.HTTPError) as e:
+        zhcal.get_content_length({'content-length': value})
+    assert e.value.status == status
+
+
+def test_read_request_head_errors():
+    async def read(request_line, rest):
+        reader = asyncio.StreamReader(limit=256)
+        reader.feed_data(rest)
+        reader.feed_eof()
+        return await zhcal.read_request_head(reader, request_line)
+
+    with pytest.raises(zhcal.HTTPError) as e:
+        asyncio.run(read(b'GARBAGE\r\n', b'\r\n'))
+    assert e.value.status == 400
+    with pytest.raises(zhcal.HTTPError) as e:
+        asyncio.run(read(b'GET / HTTP/1.1\r\n',
+                         b'X-Long: ' + b'a' * 1024 + b'\r\n\r\n'))
+    assert e.value.status == 431
+    method, target, version, headers = asyncio.run(
+        read(b'GET /pillars HTTP/1.1\r\n', b'Host: x\r\n\r\n')
+    )
+    assert (method, target, headers['host']) == ('GET', '/pillars', 'x')
+
+
+# 調用統計
+
+def test_stats_times_generators_and_table_builders():
+    zhcal.enable_stats()
+    try:
+        assert zhcal.MONTH_INDEX.build is zhcal.build_month_index
+        events = zhcal.iter_ics_events(datetime.date(2020, 1, 1),
+                                       datetime.date(2020, 1, 31))
+        first = next(events)
+        assert first
+        time.sleep(0.05)
+        events.close()
+        record = zhcal.get_stats()['functions']['iter_ics_events']
+        assert record['calls'] == 1
+        # 使用者在兩次取值之間的時間不計入
+        assert record['total'] < 0.05
+    finally:
+        zhcal.disable_stats()
+        zhcal.reset_stats()
+    assert not hasattr(zhcal.MONTH_INDEX.build, '__wrapped__')
+    assert not hasattr(zhcal.SERVE_ROUTES['/pillars'], '__wrapped__')
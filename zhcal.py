@@ -1,9 +1,20 @@
 #!/usr/bin/env python3
 
 
-import argparse
+import time
+# 在導入其他模塊之前計時，--startup-profile 報告的導入耗時包括它們
+IMPORT_START = time.perf_counter()
+
+import _thread
 import datetime
-from calendar import Calendar
+import math
+import os
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
 
 
 # 每年元旦的農曆日期 (1900-2049)
@@ -14,6 +25,7 @@ LUNAR_DATE_OF_INITIAL_DAYS = [0x41, 0xb, 0x16, 0x43, 0xe, 0x1a, 0x47, 0x11, 0x1c
 # 每年的月長和閏月數據 (1900-2049)
 # 16 位整數，高 12 位表示月長，低 4 位表示閏月
 # 月長： 0: 小月, 1: 大月
+# 閏月： 0xf 表示上一年的閏月為大月（當年無閏月）
 LUNAR_MONTH_LENGTH = [0x4bd8, 0x4ae0, 0xa570, 0x54d5, 0xd260, 0xd950, 0x5554, 0x56af, 0x9ad0, 0x55d2, 0x4ae0, 0xa5b6, 0xa4d0, 0xd250, 0xd295, 0xb54f, 0xd6a0, 0xada2, 0x95b0, 0x4977, 0x497f, 0xa4b0, 0xb4b5, 0x6a50, 0x6d40, 0xab54, 0x2b6f, 0x9570, 0x52f2, 0x4970, 0x6566, 0xd4a0, 0xea50, 0x6a95, 0x5adf, 0x2b60, 0x86e3, 0x92ef, 0xc8d7, 0xc95f, 0xd4a0, 0xd8a6, 0xb55f, 0x56a0, 0xa5b4, 0x25df, 0x92d0, 0xd2b2, 0xa950, 0xb557, 0x6ca0, 0xb550, 0x5355, 0x4daf, 0xa5b0, 0x4573, 0x52bf, 0xa9a8, 0xe950, 0x6aa0, 0xaea6, 0xab50, 0x4b60, 0xaae4, 0xa570, 0x5260, 0xf263, 0xd950, 0x5b57, 0x56a0, 0x96d0, 0x4dd5, 0x4ad0, 0xa4d0, 0xd4d4, 0xd250, 0xd558, 0xb540, 0xb6a0, 0x95a6, 0x95bf, 0x49b0, 0xa974, 0xa4b0, 0xb27a, 0x6a50, 0x6d40, 0xaf46, 0xab60, 0x9570, 0x4af5, 0x4970, 0x64b0, 0x74a3, 0xea50, 0x6b58, 0x5ac0, 0xab60, 0x96d5, 0x92e0, 0xc960, 0xd954, 0xd4a0, 0xda50, 0x7552, 0x56a0, 0xabb7, 0x25d0, 0x92d0, 0xcab5, 0xa950, 0xb4a0, 0xbaa4, 0xad50, 0x55d9, 0x4ba0, 0xa5b0, 0x5176, 0x52bf, 0xa930, 0x7954, 0x6aa0, 0xad50, 0x5b52, 0x4b60, 0xa6e6, 0xa4e0, 0xd260, 0xea65, 0xd530, 0x5aa0, 0x76a3, 0x96d0, 0x4afb, 0x4ad0, 0xa4d0, 0xd0b6, 0xd25f, 0xd520, 0xdd45, 0xb5a0, 0x56d0, 0x55b2, 0x49b0, 0xa577, 0xa4b0, 0xaa50, 0xb255, 0x6d2f, 0xada0, 0x4b63, 0x937f, 0x49f8, 0x4970, 0x64b0, 0x68a6, 0xea5f, 0x6b20, 0xa6c4, 0xaaef, 0x92e0, 0xd2e3, 0xc960, 0xd557, 0xd4a0, 0xda50, 0x5d55, 0x56a0, 0xa6d0, 0x55d4, 0x52d0, 0xa9b8, 0xa950, 0xb4a0, 0xb6a6, 0xad50, 0x55a0, 0xaba4, 0xa5b0, 0x52b0, 0xb273, 0x6930, 0x7337, 0x6aa0, 0xad50, 0x4b55, 0x4b6f, 0xa570, 0x54e4, 0xd260, 0xe968, 0xd520, 0xdaa0, 0x6aa6, 0x56df, 0x4ae0, 0xa9d4, 0xa4d0, 0xd150, 0xf252, 0xd520]
 
 # Data from Sean Lin (sean.o4u.com)
@@ -111,6 +123,10 @@ MONTHS = ['#', '一', '二', '三', '四', '五', '六', '七', '八', '九', '
 
 DAY_SEC = 86400
 TS_ZERO = datetime.date(1970, 1, 1)
+# 日序數：距 1901 年元旦的天數
+ORDINAL_ZERO = datetime.date(1901, 1, 1).toordinal()
+ORDINAL_ZERO_TS = -2177452800
+DAY_COUNT = datetime.date(2050, 1, 1).toordinal() - ORDINAL_ZERO
 # 1970 年：庚戌年
 TS_ZERO_YEAR_CYCLE_INDEX = 46
 # 1970 年小寒之前：丙子月
@@ -153,16 +169,10 @@ def get_cycle_60(cycle_10, cycle_12):
     @param int cycle_12 in range(0, 12)
     @return int in range(0, 60)
     '''
-    result = 0
-    i = 0
-    j = 0
-    for k in range(0, 60):
-        if i == cycle_10 and j == cycle_12:
-            result = k
-            break
-        i = (i + 1) % 10
-        j = (j + 1) % 12
-    return result
+    if (cycle_10 - cycle_12) % 2:
+        return 0
+    # 中國剩餘定理：k ≡ cycle_10 (mod 10), k ≡ cycle_12 (mod 12)
+    return cycle_10 + 10 * (5 * ((cycle_12 - cycle_10) // 2) % 6)
 
 
 def get_lunar_date_str(index):
@@ -198,6 +208,24 @@ def date2ts(date):
     return int((date - TS_ZERO).total_seconds())
 
 
+def date2ordinal(date):
+    '''將 date object 轉換為日序數（距 1901 年元旦的天數）
+
+    @param datetime.date date
+    @return int
+    '''
+    return date.toordinal() - ORDINAL_ZERO
+
+
+def ordinal2date(ordinal):
+    '''將日序數轉換為 date object
+
+    @param int ordinal
+    @return datetime.date
+    '''
+    return datetime.date.fromordinal(ordinal + ORDINAL_ZERO)
+
+
 def is_leap_year(year):
     '''判斷閏年
 
@@ -210,8 +238,8 @@ def is_leap_year(year):
         return (year % 4 == 0)
 
 
-def get_solar_term_date(index, year):
-    '''計算節氣日期
+def decode_solar_term_date(index, year):
+    '''從 SOLAR_TERM_* 數據解碼節氣日期
 
     Algorithm from Sean Lin (sean.o4u.com)
 
@@ -224,13 +252,105 @@ def get_solar_term_date(index, year):
     ))
 
 
+def build_solar_term_index():
+    '''生成 1901-2049 全部節氣的日序數（按時間順序排列）
+
+    @return array<int> 下標為 (year - 1901) * 24 + index
+    '''
+    result = array('l')
+    for year in range(1901, 2050):
+        for index in range(0, 24):
+            result.append(date2ordinal(decode_solar_term_date(index, year)))
+    return result
+
+
+def get_solar_term_date(index, year):
+    '''計算節氣日期
+
+    @param int index in range(0, 24)
+    @param int year in range(1901, 2050)
+    @return datetime.date
+    '''
+    if index not in range(0, 24):
+        raise ValueError('Invalid solar term index')
+    check_year_range(year)
+    return ordinal2date(SOLAR_TERM_TABLE['ordinal'][(year-1901)*24 + index])
+
+
+def get_solar_term(position):
+    '''返回 SOLAR_TERM_TABLE['ordinal'] 中第 position 個節氣的信息
+
+    @param int position
+    @return dict { index, year, name, date }
+    '''
+    if position not in range(0, len(SOLAR_TERM_TABLE['ordinal'])):
+        raise NotImplementedError('Out of data range')
+    return {
+        'index': position % 24,
+        'year': 1901 + position // 24,
+        'name': SOLAR_TERMS[position % 24],
+        'date': ordinal2date(SOLAR_TERM_TABLE['ordinal'][position])
+    }
+
+
+def get_solar_term_period(date):
+    '''返回 date 所在的節氣時段（當日或之前最近的節氣）
+
+    @param datetime.date date (1901 年小寒 - 2049/12/31)
+    @return dict { index, year, name, date }
+    '''
+    ordinal = date2ordinal(date)
+    if ordinal not in range(0, DAY_COUNT):
+        raise NotImplementedError('Out of data range')
+    return get_solar_term(
+        bisect_right(SOLAR_TERM_TABLE['ordinal'], ordinal) - 1
+    )
+
+
+def get_next_solar_term(date):
+    '''返回 date 之後的下一個節氣（不含當日）
+
+    @param datetime.date date (1901/1/1 - 2049 年冬至前一日)
+    @return dict { index, year, name, date }
+    '''
+    ordinal = date2ordinal(date)
+    if ordinal not in range(0, DAY_COUNT):
+        raise NotImplementedError('Out of data range')
+    return get_solar_term(
+        bisect_right(SOLAR_TERM_TABLE['ordinal'], ordinal)
+    )
+
+
+def get_prev_solar_term(date):
+    '''返回 date 之前的上一個節氣（不含當日）
+
+    @param datetime.date date (1901 年小寒次日 - 2049/12/31)
+    @return dict { index, year, name, date }
+    '''
+    ordinal = date2ordinal(date)
+    if ordinal not in range(0, DAY_COUNT):
+        raise NotImplementedError('Out of data range')
+    return get_solar_term(
+        bisect_left(SOLAR_TERM_TABLE['ordinal'], ordinal) - 1
+    )
+
+
 def get_leap_month(year):
     '''返回當年閏月，0 代表沒有閏月
 
     @param int year in range(1901, 2050)
     @return int in range(0, 13)
     '''
-    month = LUNAR_MONTH_LENGTH[year-1900] & 0xf
+    return decode_leap_month(LUNAR_MONTH_LENGTH[year-1900])
+
+
+def decode_leap_month(code):
+    '''從 LUNAR_MONTH_LENGTH 格式的數據解碼閏月
+
+    @param int code
+    @return int in range(0, 13)
+    '''
+    month = code & 0xf
     if month == 0xf:
         return 0
     else:
@@ -244,93 +364,293 @@ def get_month_day_count(month, year):
     @param int year in range(1901, 2050)
     @return int in range(29, 31)
     '''
+    return decode_month_day_count(LUNAR_MONTH_LENGTH[year-1900],
+                                  LUNAR_MONTH_LENGTH[year+1-1900], month)
+
+
+def decode_month_day_count(code, next_code, month):
+    '''從 LUNAR_MONTH_LENGTH 格式的數據解碼月長
+
+    @param int code 當年數據
+    @param int next_code 次年數據
+    @param int month in range(0, 13) 0 表示閏月
+    @return int in range(29, 31)
+    '''
     if month:
-        if LUNAR_MONTH_LENGTH[year-1900] & (0x10000 >> month):
+        if code & (0x10000 >> month):
             return 30
         else:
             return 29
     else:
-        if get_leap_month(year+1):
+        # 閏月的大小記錄在次年數據的低 4 位：0xf 表示閏大月
+        if next_code & 0xf == 0xf:
             return 30
         else:
             return 29
 
 
-def build_calendar(year):
-    '''生成農曆年曆數據
+def build_month_index():
+    '''生成 1901-2049 所涉及的農曆月索引（按時間順序）
 
-    @param int year in range(1901, 2050)
-    @return list<
-        dict { lunar_month, lunar_date, is_leap_month, timestamp }
-    >
+    @return dict {
+        lunar_year: array<int>,
+        lunar_month: array<int>,
+        is_leap_month: array<int>,
+        start: array<int> 每月初一的日序數，末尾多一項作為結束標記
+    }
     '''
-    initial_month = (
-        LUNAR_DATE_OF_INITIAL_DAYS[year-1900] & (0x3 << 6)
-    ) >> 6
-    initial_date = LUNAR_DATE_OF_INITIAL_DAYS[year-1900] & 0x3f
-    leap_prev = get_leap_month(year-1)
-    leap = get_leap_month(year)
-    year_day_count = 365 + is_leap_year(year)
+    initial_month = LUNAR_DATE_OF_INITIAL_DAYS[1] >> 6
+    initial_date = LUNAR_DATE_OF_INITIAL_DAYS[1] & 0x3f
+    # 1901 年元旦所在的農曆月
+    first = [(11, False), (12, False), (11, True)][initial_month]
 
-    data = []
-    result = []
+    result = {
+        'lunar_year': array('H'),
+        'lunar_month': array('B'),
+        'is_leap_month': array('B'),
+        'start': array('l')
+    }
+    start = 1 - initial_date
+    started = False
+    for year in range(1900, 2050):
+        leap = get_leap_month(year)
+        for i in range(1, 13):
+            months = [(i, False)]
+            if leap == i:
+                months.append((i, True))
+            for month in months:
+                if not started:
+                    if month != first:
+                        continue
+                    started = True
+                if start >= DAY_COUNT:
+                    break
+                result['lunar_year'].append(year)
+                result['lunar_month'].append(month[0])
+                result['is_leap_month'].append(month[1])
+                result['start'].append(start)
+                start += get_month_day_count(0 if month[1] else i, year)
+    result['start'].append(start)
+    return result
 
-    if initial_month == 0:
-        # 冬月
-        data.append({
-            'index': 11,
-            'day_count': get_month_day_count(11, year-1),
-            'is_leap': False
-        })
-        # 千年難尋閏臘月，因此不判定閏臘月
-    elif initial_month == 1:
-        # 臘月
-        pass
-    elif initial_month == 2:
-        # 閏冬月
-        data.append({
-            'index': 11,
-            'day_count': get_month_day_count(0, year-1),
-            'is_leap': True
-        })
-    data.append({
-        'index': 12,
-        'day_count': get_month_day_count(12, year-1),
-        'is_leap': False
-    })
 
-    for i in range(1, 13):
-        data.append({
-            'index': i,
-            'day_count': get_month_day_count(i, year),
-            'is_leap': False
-        })
-        if leap == i:
-            data.append({
-                'index': i,
-                'day_count': get_month_day_count(0, year),
-                'is_leap': True
-            })
+def build_day_index(month_index):
+    '''生成 1901-2049 逐日的農曆數據索引（以日序數為下標）
+
+    @param dict month_index 由 build_month_index() 生成
+    @return dict {
+        lunar_year, lunar_month, lunar_date, is_leap_month
+    } of array<int>
+    '''
+    result = {
+        'lunar_year': array('H'),
+        'lunar_month': array('B'),
+        'lunar_date': array('B'),
+        'is_leap_month': array('B')
+    }
+    starts = month_index['start']
+    dates = array('B', range(1, 31))
+    for i in range(0, len(starts) - 1):
+        begin = max(starts[i], 0)
+        end = min(starts[i+1], DAY_COUNT)
+        count = end - begin
+        for key in ['lunar_year', 'lunar_month', 'is_leap_month']:
+            column = result[key]
+            column.extend(
+                array(column.typecode, [month_index[key][i]]) * count
+            )
+        result['lunar_date'].extend(
+            dates[begin - starts[i]:end - starts[i]]
+        )
+    return result
 
-    ts = date2ts(datetime.date(year, 1, 1))
-    lunar_date = initial_date
-    j = 0
-    for i in range(0, year_day_count):
-        if lunar_date > data[j]['day_count']:
-            lunar_date = 1
-            j += 1
-        result.append({
-            'timestamp': ts,
-            'lunar_date': lunar_date,
-            'lunar_month': data[j]['index'],
-            'is_leap_month': data[j]['is_leap']
-        })
-        lunar_date += 1
-        ts += DAY_SEC
 
+def build_month_lookup(month_index):
+    '''生成從農曆月到月索引位置的反查表
+
+    @param dict month_index 由 build_month_index() 生成
+    @return dict { (lunar_year, lunar_month, is_leap_month): int }
+    '''
+    result = {}
+    for i in range(0, len(month_index['lunar_month'])):
+        result[(
+            month_index['lunar_year'][i],
+            month_index['lunar_month'][i],
+            bool(month_index['is_leap_month'][i])
+        )] = i
     return result
 
 
+class LRUCache(object):
+    '''容量有限的近似 LRU 緩存，記錄命中與未命中次數
+
+    線程安全：命中時不加鎖，只讀取條目並設置其訪問標記；插入、淘汰和
+    clear 在 lock 內進行。淘汰採用 clock 算法：從最早放入的條目開始，
+    帶訪問標記的條目清除標記後移到末尾，沒有標記的條目被淘汰。build
+    在 lock 外運行，每個正在生成的鍵另有一把鎖，同一個鍵只生成一次，
+    其他線程等待後重新查找，不同的鍵可以同時生成。clear 以後，之前
+    開始的生成結果不再放入緩存。hits 在鎖外累加，多線程下只是近似值
+    '''
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # key: [value, 訪問標記]
+        self.data = OrderedDict()
+        self.lock = _thread.allocate_lock()
+        # key: 正在生成該鍵的線程持有的鎖
+        self.building = {}
+        # 每次 clear 加一
+        self.generation = 0
+
+    def get(self, key, build):
+        '''返回 key 對應的值，未命中時調用 build(key) 生成並緩存
+
+        @param hashable key
+        @param callable build
+        @return object
+        '''
+        entry = self.data.get(key)
+        if entry is not None:
+            self.hits += 1
+            entry[1] = True
+            return entry[0]
+        while True:
+            with self.lock:
+                entry = self.data.get(key)
+                if entry is not None:
+                    self.hits += 1
+                    entry[1] = True
+                    return entry[0]
+                waiting = self.building.get(key)
+                if waiting is None:
+                    self.misses += 1
+                    generation = self.generation
+                    waiting = _thread.allocate_lock()
+                    waiting.acquire()
+                    self.building[key] = waiting
+                    break
+            # 其他線程正在生成同一個鍵：等待完成後重新查找
+            with waiting:
+                pass
+        try:
+            value = build(key)
+            with self.lock:
+                if self.maxsize > 0 and self.generation == generation:
+                    self.data[key] = [value, False]
+                    self.trim()
+        finally:
+            with self.lock:
+                del self.building[key]
+            waiting.release()
+        return value
+
+    def trim(self):
+        # 調用者持有 lock；最多給每個條目一次機會，命中在鎖外並發設置
+        # 標記也不會讓循環無限進行
+        chances = len(self.data)
+        while len(self.data) > self.maxsize:
+            key, entry = self.data.popitem(last=False)
+            if entry[1] and chances > 0:
+                chances -= 1
+                entry[1] = False
+                self.data[key] = entry
+
+    def resize(self, maxsize):
+        '''調整緩存容量
+
+        @param int maxsize >= 0
+        '''
+        with self.lock:
+            self.maxsize = maxsize
+            self.trim()
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.generation += 1
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        '''@return dict { hits, misses, maxsize, currsize }'''
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'maxsize': self.maxsize,
+            'currsize': len(self.data)
+        }
+
+
+class YearCalendar(object):
+    '''一年的農曆年曆數據（不可變）
+
+    以每日的月、日、閏月三列 bytes 以及各農曆月在當年開始的位置存儲，
+    按下標或迭代訪問時返回新建的
+    dict { lunar_month, lunar_date, is_leap_month, timestamp }
+    '''
+
+    __slots__ = ('year', 'ordinal', 'month_starts', 'lunar_month',
+                 'lunar_date', 'is_leap_month')
+
+    def __init__(self, year):
+        begin = date2ordinal(datetime.date(year, 1, 1))
+        end = begin + 365 + is_leap_year(year)
+        lunar_date = bytes(DAY_INDEX['lunar_date'][begin:end])
+        set_attr = super(YearCalendar, self).__setattr__
+        set_attr('year', year)
+        set_attr('ordinal', begin)
+        set_attr('month_starts', tuple(
+            i for i in range(0, len(lunar_date))
+            if i == 0 or lunar_date[i] == 1
+        ))
+        set_attr('lunar_month', bytes(DAY_INDEX['lunar_month'][begin:end]))
+        set_attr('lunar_date', lunar_date)
+        set_attr('is_leap_month',
+                 bytes(DAY_INDEX['is_leap_month'][begin:end]))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('YearCalendar is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('YearCalendar is immutable')
+
+    def __len__(self):
+        return len(self.lunar_date)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index not in range(0, len(self)):
+            raise IndexError('YearCalendar index out of range')
+        return {
+            'timestamp': ORDINAL_ZERO_TS + (self.ordinal + index) * DAY_SEC,
+            'lunar_date': self.lunar_date[index],
+            'lunar_month': self.lunar_month[index],
+            'is_leap_month': bool(self.is_leap_month[index])
+        }
+
+    def __iter__(self):
+        for i in range(0, len(self)):
+            yield self[i]
+
+
+CALENDAR_CACHE = LRUCache(16)
+
+
+def build_calendar(year):
+    '''生成農曆年曆數據（結果緩存於 CALENDAR_CACHE）
+
+    @param int year in range(1901, 2050)
+    @return YearCalendar 可迭代得到 list<
+        dict { lunar_month, lunar_date, is_leap_month, timestamp }
+    >
+    '''
+    check_year_range(year)
+    return CALENDAR_CACHE.get(year, YearCalendar)
+
+
 def get_year_cycle_index_approx(year):
     '''干支紀年：返回當年立春以後的年柱六十甲子索引
 
@@ -349,8 +669,11 @@ def get_year_cycle_index(date):
     @param datetime.date date (1901/1/1 - 2049/12/31)
     @return int in range(0, 60)
     '''
+    check_year_range(date.year)
     index = get_year_cycle_index_approx(date.year)
-    if(date < get_solar_term_date(2, date.year)):
+    # 立春
+    start = SOLAR_TERM_TABLE['ordinal'][(date.year-1901)*24 + 2]
+    if date2ordinal(date) < start:
         index = (index - 1) % 60
     return index
 
@@ -361,13 +684,11 @@ def get_month_cycle_index(date):
     @param datetime.date date (1901/1/1 - 2049/12/31)
     @return int in range(0, 60)
     '''
-    start_index = (TS_ZERO_MONTH_CYCLE_INDEX + (date.year - 1970) * 12) % 60
-    add = 12
-    for i in range(0, 12):
-        if date < get_solar_term_date(i*2, date.year):
-            add = i
-            break
-    return (start_index + add) % 60
+    check_year_range(date.year)
+    # 1901 年小寒以來經過的節（偶數索引的節氣）數
+    count = (bisect_right(SOLAR_TERM_TABLE['ordinal'], date2ordinal(date))
+             + 1) // 2
+    return (TS_ZERO_MONTH_CYCLE_INDEX + (1901 - 1970) * 12 + count) % 60
 
 
 def get_day_cycle_index(date):
@@ -425,237 +746,4005 @@ def get_zodiac(date):
     return index
 
 
-def get_festivals_date(year):
-    '''返回當年農曆節日的格里曆日期
+def build_pillar_index():
+    '''生成 1901-2049 逐日的年柱、月柱、日柱六十甲子索引（以日序數為下標）
 
-    @param int year in range(1901, 2050)
-    @return list<
-        dict { date, name }
-    >
+    @return dict { year, month, day } of array<int>
     '''
-    result = []
-    days = build_calendar(year)
-    prev_day_lunar_date = -1
-    for day in days:
-        for festival in FESTIVALS:
-            if festival['date'][0] == day['lunar_month']:
-                if festival['date'][1] == day['lunar_date']:
-                    result.append({
-                        'date': datetime.datetime.utcfromtimestamp(
-                            day['timestamp']
-                        ).date(),
-                        'lunar_date': festival['date'],
-                        'name': festival['name']
-                    })
-                elif (festival['date'][1] == 0 and day['lunar_date'] == 1
-                      and prev_day_lunar_date != -1):
-                    result.append({
-                        'date': datetime.datetime.utcfromtimestamp(
-                            day['timestamp'] - DAY_SEC
-                        ).date(),
-                        'lunar_date': (
-                            (festival['date'][0] - 1 - 1) % 12 + 1,
-                            prev_day_lunar_date
-                        ),
-                        'name': festival['name']
-                    })
-        prev_day_lunar_date = day['lunar_date']
+    result = {
+        'year': array('B'),
+        'month': array('B'),
+        'day': array('B')
+    }
+
+    # 以立春為界
+    bounds = [0] + list(SOLAR_TERM_TABLE['ordinal'][2::24]) + [DAY_COUNT]
+    for i in range(0, len(bounds) - 1):
+        result['year'].extend(
+            array('B', [get_year_cycle_index_approx(1900 + i)])
+            * (bounds[i+1] - bounds[i])
+        )
+
+    # 以節為界
+    bounds = [0] + list(SOLAR_TERM_TABLE['ordinal'][0::2]) + [DAY_COUNT]
+    start_index = TS_ZERO_MONTH_CYCLE_INDEX + (1901 - 1970) * 12
+    for i in range(0, len(bounds) - 1):
+        result['month'].extend(
+            array('B', [(start_index + i) % 60]) * (bounds[i+1] - bounds[i])
+        )
+
+    start_index = (TS_ZERO_DAY_CYCLE_INDEX + ORDINAL_ZERO_TS // DAY_SEC) % 60
+    cycle = array('B', range(0, 60))
+    result['day'] = (cycle * (DAY_COUNT // 60 + 2))[
+        start_index:start_index + DAY_COUNT
+    ]
     return result
 
 
-def gregorian_to_zh(date):
-    '''格里曆轉農曆
+def get_pillars_by_ordinal(ordinal, hour):
+    '''由日序數和小時返回四柱
 
-    @param datetime.date date (1900/1/1 - 2049/12/31)
-    @return dict { lunar_month, lunar_date, is_leap_month, timestamp }
+    @param int ordinal in range(0, DAY_COUNT)
+    @param int hour in range(0, 24)
+    @return tuple(year, month, day, hour) 六十甲子索引
     '''
-    ts = date2ts(date)
-    days = build_calendar(date.year)
-    for day in days:
-        if day['timestamp'] == ts:
-            return day
+    if ordinal not in range(0, DAY_COUNT):
+        raise NotImplementedError('Out of data range')
+    day = PILLAR_INDEX['day'][ordinal]
+    return (
+        PILLAR_INDEX['year'][ordinal],
+        PILLAR_INDEX['month'][ordinal],
+        day,
+        # 時干由日干推出：甲己日起甲子時
+        (day % 5 * 12 + (hour + 1) // 2 % 12) % 60
+    )
 
 
-def zh_to_gregorian(year, lunar_month, lunar_date, is_leap_month):
-    '''農曆轉格里曆
+def get_four_pillars(date_time):
+    '''返回四柱（六十甲子索引）
 
-    @param int year in range(1901, 2050)
-    @param int lunar_month in range(1, 13)
-    @param int lunar_date in range(1, 31)
-    @param bool is_leap_month
-    @return datetime.date
+    @param datetime.datetime date_time 無時區信息時視為 UTC+8 時間
+    @return tuple(year, month, day, hour)
     '''
-    target = {
-        'lunar_month': lunar_month,
-        'lunar_date': lunar_date,
-        'is_leap_month': is_leap_month
-    }
-    days = build_calendar(year)
-    for day in days:
-        ts = day['timestamp']
-        del day['timestamp']
-        if day == target:
-            return datetime.datetime.utcfromtimestamp(ts).date()
+    if date_time.tzinfo is not None:
+        date_time = date_time.astimezone(tz)
+    return get_pillars_by_ordinal(date2ordinal(date_time.date()),
+                                  date_time.hour)
 
 
-def inverse_color(string):
-    return '\033[7m' + string + '\033[0m'
+def decode_lunar_day(date):
+    '''由壓縮數據直接解碼一日的農曆日期，不生成 DAY_INDEX
 
+    只從當年元旦所在的農曆月向後數，適合只查一天的場合（info、now）
 
-def num_prepend_blank(num):
-    result = str(num)
-    if len(result) < 2:
-        result = ' ' + result
-    return result
+    @param datetime.date date (1901/1/1 - 2049/12/31)
+    @return tuple(lunar_year, lunar_month, lunar_date, is_leap_month)
+    '''
+    check_year_range(date.year)
+    code = LUNAR_DATE_OF_INITIAL_DAYS[date.year-1900]
+    lunar_month, is_leap_month = [(11, False), (12, False), (11, True)][
+        code >> 6
+    ]
+    lunar_year = date.year - 1
+    # 距元旦所在農曆月初一的天數
+    offset = (code & 0x3f) + date.timetuple().tm_yday - 2
+    while True:
+        length = get_month_day_count(0 if is_leap_month else lunar_month,
+                                     lunar_year)
+        if offset < length:
+            return (lunar_year, lunar_month, offset + 1, is_leap_month)
+        offset -= length
+        if not is_leap_month and get_leap_month(lunar_year) == lunar_month:
+            is_leap_month = True
+        else:
+            is_leap_month = False
+            lunar_month += 1
+            if lunar_month > 12:
+                lunar_month = 1
+                lunar_year += 1
 
 
-def print_datetime(date_time):
-    check_datetime_range(date_time)
-    date = date_time.date()
-    time = date_time.time()
-    zh = gregorian_to_zh(date_time.date())
-    lunar_month_prefix = ''
-    if zh['is_leap_month']:
-        lunar_month_prefix = '閏'
-    print(
-'''
-西元 %(year)d 年 %(month)d 月 %(day)d 日  週%(weekday)s
-農曆 %(lunar_month)s月%(lunar_date)s  生肖：%(zodiac)s
-四柱 %(year_cycle)s年  %(month_cycle)s月  %(day_cycle)s日  %(hour_cycle)s時
-時間 東八區 %(hour)d 時 %(minute)d 分 %(second)d 秒  %(c_quarter)s刻
-''' % {
-    'year': date.year,
-    'month': date.month,
-    'day': date.day,
-    'weekday': WEEKDAYS[date.weekday()],
-    'lunar_month': lunar_month_prefix + LUNAR_MONTHS[zh['lunar_month']],
-    'lunar_date': get_lunar_date_str(zh['lunar_date']),
-    'zodiac': ZODIAC[get_zodiac(date)],
-    'year_cycle': CYCLE_60[get_year_cycle_index(date)],
-    'month_cycle': CYCLE_60[get_month_cycle_index(date)],
-    'day_cycle': CYCLE_60[get_day_cycle_index(date)],
-    'hour_cycle': CYCLE_60[get_hour_cycle_index(date_time)],
-    'hour': date_time.hour,
-    'minute': date_time.minute,
-    'second': date_time.second,
-    'c_quarter': QUARTERS[get_quarter(time)]
-      }
-    )
+def decode_four_pillars(date, hour):
+    '''由壓縮數據直接計算四柱，不生成 SOLAR_TERM_TABLE 和 PILLAR_INDEX
 
+    @param datetime.date date (1901/1/1 - 2049/12/31)
+    @param int hour in range(0, 24)
+    @return tuple(year, month, day, hour) 六十甲子索引
+    '''
+    check_year_range(date.year)
+    year = get_year_cycle_index_approx(date.year)
+    # 立春
+    if date < decode_solar_term_date(2, date.year):
+        year = (year - 1) % 60
+    # 當年已過的節數
+    count = 0
+    while count < 12 and date >= decode_solar_term_date(count * 2, date.year):
+        count += 1
+    day = get_day_cycle_index(date)
+    return (
+        year,
+        (TS_ZERO_MONTH_CYCLE_INDEX + (date.year - 1970) * 12 + count) % 60,
+        day,
+        (day % 5 * 12 + (hour + 1) // 2 % 12) % 60
+    )
+
+
+def get_offset_seconds(utc_offset):
+    '''將 UTC 偏移量換算為秒數
+
+    @param int or float or datetime.timedelta utc_offset 小時數或 timedelta
+    @return int in range(-DAY_SEC + 1, DAY_SEC)
+    '''
+    if isinstance(utc_offset, datetime.timedelta):
+        seconds = utc_offset.total_seconds()
+    else:
+        seconds = utc_offset * 3600
+    if seconds != int(seconds) or abs(seconds) >= DAY_SEC:
+        raise ValueError('Invalid UTC offset')
+    return int(seconds)
+
+
+def split_timestamp(timestamp, offset):
+    '''將 UNIX 時間戳拆分為當地日序數和當日秒數
+
+    @param int or numpy integer array timestamp UNIX 時間戳（秒，已取整）
+    @param int offset 與 UTC 相差的秒數，見 get_offset_seconds
+    @return tuple(ordinal, seconds) seconds in range(0, DAY_SEC)
+    '''
+    return divmod(timestamp + (offset - ORDINAL_ZERO_TS), DAY_SEC)
+
+
+def get_four_pillars_many(values, utc_offset=8):
+    '''批量返回四柱
+
+    @param iterable<datetime.datetime or int or float> values
+        datetime 無時區信息時視為 UTC+8 時間，數字為 UNIX 時間戳（秒）
+    @param int or float or datetime.timedelta utc_offset 時間戳所用的時區，
+        默認 UTC+8
+    @return list<tuple(year, month, day, hour)>
+    '''
+    result = []
+    offset = get_offset_seconds(utc_offset)
+    for value in values:
+        if isinstance(value, datetime.datetime):
+            result.append(get_four_pillars(value))
+        else:
+            ordinal, seconds = split_timestamp(math.floor(value), offset)
+            result.append(get_pillars_by_ordinal(ordinal, seconds // 3600))
+    return result
+
+
+def iter_four_pillars(start, end, step):
+    '''按固定步長逐個生成 [start, end) 內各時刻的四柱
+
+    @param datetime.datetime start 無時區信息時視為 UTC+8 時間
+    @param datetime.datetime end
+    @param datetime.timedelta step > 0
+    @return generator<tuple(datetime.datetime, tuple(year, month, day, hour))>
+    '''
+    if step <= datetime.timedelta(0):
+        raise ValueError('step must be positive')
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=tz)
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=tz)
+    start = start.astimezone(tz)
+    # 以 UTC+8 當地時間的秒數遞增，避免逐個換算時區
+    seconds = date2ordinal(start.date()) * DAY_SEC + (
+        start.hour * 3600 + start.minute * 60 + start.second
+    )
+    step_seconds = step.total_seconds()
+    date_time = start
+    while date_time < end:
+        whole = int(seconds)
+        yield date_time, get_pillars_by_ordinal(
+            whole // DAY_SEC, whole % DAY_SEC // 3600
+        )
+        seconds += step_seconds
+        date_time += step
+
+
+FESTIVAL_LUNAR = 0
+FESTIVAL_SOLAR = 1
+FESTIVAL_TYPES = ['lunar', 'solar']
+# 已發布的節日索引快照，見 get_festival_columns
+FESTIVAL_COLUMNS = None
+
+
+def get_festival_ordinals(kind, festival):
+    '''返回一個節日在 1901-2049 的全部日序數
+
+    農曆節日在每個同數字的月份（包括閏月）各算一次；日期為 0 表示上月最後
+    一天（如除夕），此時不計閏月
+
+    @param int kind FESTIVAL_LUNAR or FESTIVAL_SOLAR
+    @param dict festival FESTIVALS 或 SOLAR_FESTIVALS 中的項
+    @return list<int>
+    '''
+    result = []
+    if kind == FESTIVAL_SOLAR:
+        ordinals = SOLAR_TERM_TABLE['ordinal']
+        for year in range(1901, 2050):
+            result.append(
+                ordinals[(year-1901)*24 + festival['index']]
+                + festival['delta']
+            )
+    else:
+        month, date = festival['date']
+        starts = MONTH_INDEX['start']
+        months = MONTH_INDEX['lunar_month']
+        for i in range(0, len(months)):
+            if months[i] != month:
+                continue
+            if date == 0:
+                if not MONTH_INDEX['is_leap_month'][i]:
+                    result.append(starts[i] - 1)
+            elif date <= starts[i+1] - starts[i]:
+                result.append(starts[i] + date - 1)
+    return [ordinal for ordinal in result if ordinal in range(0, DAY_COUNT)]
+
+
+def build_festival_index():
+    '''生成 1901-2049 全部節日（FESTIVALS 與 SOLAR_FESTIVALS）的索引，
+    按 (日序數, 類型, 節日索引) 排序
+
+    @return dict {
+        ordinal,
+        kind: FESTIVAL_LUNAR or FESTIVAL_SOLAR,
+        festival: FESTIVALS 或 SOLAR_FESTIVALS 中的索引
+    } of array<int>
+    '''
+    entries = []
+    for kind, festivals in [(FESTIVAL_LUNAR, FESTIVALS),
+                            (FESTIVAL_SOLAR, SOLAR_FESTIVALS)]:
+        for i in range(0, len(festivals)):
+            for ordinal in get_festival_ordinals(kind, festivals[i]):
+                entries.append((ordinal, kind, i))
+    entries.sort()
+    result = {
+        'ordinal': array('i'),
+        'kind': array('B'),
+        'festival': array('H')
+    }
+    for ordinal, kind, i in entries:
+        result['ordinal'].append(ordinal)
+        result['kind'].append(kind)
+        result['festival'].append(i)
+    return result
+
+
+def get_festival_columns():
+    '''返回節日索引的快照
+
+    快照發布後不再修改；add_festival 在副本上修改後以一次賦值發布新的
+    快照，因此讀者每次調用只取一次，便不會讀到更新了一半的索引
+
+    @return tuple(ordinal, kind, festival) 各列含義同 build_festival_index
+    '''
+    global FESTIVAL_COLUMNS
+    columns = FESTIVAL_COLUMNS
+    if columns is None:
+        index = FESTIVAL_INDEX.load()
+        with FESTIVAL_INDEX.lock:
+            if FESTIVAL_COLUMNS is None:
+                FESTIVAL_COLUMNS = (index['ordinal'], index['kind'],
+                                    index['festival'])
+            columns = FESTIVAL_COLUMNS
+    return columns
+
+
+def add_festival(kind, festival):
+    '''向節日列表添加一項，並增量更新已載入的節日索引
+
+    @param int kind FESTIVAL_LUNAR or FESTIVAL_SOLAR
+    @param dict festival
+    '''
+    global FESTIVAL_COLUMNS
+    festivals = [FESTIVALS, SOLAR_FESTIVALS][kind]
+    with FESTIVAL_INDEX.lock:
+        festivals.append(festival)
+        # 未載入時將在首次使用時按完整列表生成
+        if FESTIVAL_INDEX.loaded:
+            # 在副本上修改，不改動其他線程可能正在讀取的列
+            # （從數據文件映射的列本身也是只讀的）
+            ordinals, kinds, indexes = [
+                array(column.typecode if isinstance(column, array)
+                      else column.format, column)
+                for column in FESTIVAL_COLUMNS or (
+                    FESTIVAL_INDEX['ordinal'], FESTIVAL_INDEX['kind'],
+                    FESTIVAL_INDEX['festival']
+                )
+            ]
+            for ordinal in get_festival_ordinals(kind, festival):
+                position = bisect_right(ordinals, ordinal)
+                while (position > 0 and ordinals[position-1] == ordinal
+                       and kinds[position-1] > kind):
+                    position -= 1
+                ordinals.insert(position, ordinal)
+                kinds.insert(position, kind)
+                indexes.insert(position, len(festivals) - 1)
+            FESTIVAL_COLUMNS = (ordinals, kinds, indexes)
+            FESTIVAL_INDEX.update(ordinal=ordinals, kind=kinds,
+                                  festival=indexes)
+    # 新索引發布以後再清除，之前開始生成的月曆不會再放入緩存
+    GRID_CACHE.clear()
+
+
+def register_festival(name, lunar_month, lunar_date):
+    '''登記自定義農曆節日
+
+    @param str name
+    @param int lunar_month in range(1, 13)
+    @param int lunar_date in range(0, 31) 0 表示上月最後一天
+    '''
+    if lunar_month not in range(1, 13):
+        raise ValueError('Invalid lunar month')
+    if lunar_date not in range(0, 31):
+        raise ValueError('Invalid lunar date')
+    add_festival(FESTIVAL_LUNAR, {
+        'date': (lunar_month, lunar_date),
+        'name': name
+    })
+
+
+def register_solar_festival(name, index, delta=0):
+    '''登記自定義節氣節日
+
+    @param str name
+    @param int index 節氣索引 in range(0, 24)
+    @param int delta 相對節氣的天數
+    '''
+    if index not in range(0, 24):
+        raise ValueError('Invalid solar term index')
+    add_festival(FESTIVAL_SOLAR, {
+        'index': index,
+        'delta': delta,
+        'name': name
+    })
+
+
+def festivals_between(start, end):
+    '''返回 [start, end] 內的全部節日（按日期排列）
+
+    @param datetime.date start
+    @param datetime.date end
+    @return list<
+        dict { date, lunar_date, name, type: 'lunar' or 'solar' }
+    >
+    '''
+    result = []
+    ordinals, kinds, indexes = get_festival_columns()
+    for i in range(bisect_left(ordinals, date2ordinal(start)),
+                   bisect_right(ordinals, date2ordinal(end))):
+        ordinal = ordinals[i]
+        kind = kinds[i]
+        festival = [FESTIVALS, SOLAR_FESTIVALS][kind][indexes[i]]
+        result.append({
+            'date': ordinal2date(ordinal),
+            'lunar_date': (
+                DAY_INDEX['lunar_month'][ordinal],
+                DAY_INDEX['lunar_date'][ordinal]
+            ),
+            'name': festival['name'],
+            'type': FESTIVAL_TYPES[kind]
+        })
+    return result
+
+
+def festival_on(date):
+    '''返回當日的節日
+
+    @param datetime.date date
+    @return list<
+        dict { date, lunar_date, name, type: 'lunar' or 'solar' }
+    >
+    '''
+    return festivals_between(date, date)
+
+
+def get_festivals_date(year):
+    '''返回當年農曆節日的格里曆日期
+
+    @param int year in range(1901, 2050)
+    @return list<
+        dict { date, lunar_date, name }
+    >
+    '''
+    check_year_range(year)
+    result = []
+    for festival in festivals_between(datetime.date(year, 1, 1),
+                                      datetime.date(year, 12, 31)):
+        if festival['type'] == 'lunar':
+            del festival['type']
+            result.append(festival)
+    return result
+
+
+def gregorian_to_zh(date):
+    '''格里曆轉農曆
+
+    @param datetime.date date (1901/1/1 - 2049/12/31)
+    @return dict { lunar_month, lunar_date, is_leap_month, timestamp }
+    '''
+    check_year_range(date.year)
+    ordinal = date2ordinal(date)
+    return {
+        'lunar_month': DAY_INDEX['lunar_month'][ordinal],
+        'lunar_date': DAY_INDEX['lunar_date'][ordinal],
+        'is_leap_month': bool(DAY_INDEX['is_leap_month'][ordinal]),
+        'timestamp': ORDINAL_ZERO_TS + ordinal * DAY_SEC
+    }
+
+
+def zh_to_ordinal(year, lunar_month, lunar_date, is_leap_month):
+    '''農曆轉日序數
+
+    @param int year 農曆年 in range(1901, 2050)
+    @param int lunar_month in range(1, 13)
+    @param int lunar_date in range(1, 31)
+    @param bool is_leap_month
+    @return int
+    '''
+    check_year_range(year)
+    try:
+        i = MONTH_LOOKUP[(year, lunar_month, bool(is_leap_month))]
+    except KeyError:
+        if lunar_month not in range(1, 13):
+            raise ValueError('Invalid lunar month')
+        if is_leap_month:
+            raise ValueError('No such leap month')
+        raise NotImplementedError('Out of data range')
+    start = MONTH_INDEX['start'][i]
+    if lunar_date not in range(1, MONTH_INDEX['start'][i+1] - start + 1):
+        raise ValueError('Invalid lunar date')
+    ordinal = start + lunar_date - 1
+    if ordinal >= DAY_COUNT:
+        raise NotImplementedError('Out of data range')
+    return ordinal
+
+
+def zh_to_gregorian(year, lunar_month, lunar_date, is_leap_month):
+    '''農曆轉格里曆
+
+    @param int year 農曆年 in range(1901, 2050)
+    @param int lunar_month in range(1, 13)
+    @param int lunar_date in range(1, 31)
+    @param bool is_leap_month
+    @return datetime.date
+    '''
+    return ordinal2date(
+        zh_to_ordinal(year, lunar_month, lunar_date, is_leap_month)
+    )
+
+
+def lunar_segments(start, end):
+    '''返回與 [start, end] 有交集的各農曆月，時間和內存與月數成正比
+
+    @param datetime.date start (1901/1/1 - 2049/12/31)
+    @param datetime.date end
+    @return list<
+        dict { lunar_year, lunar_month, is_leap_month, start, end, length }
+    > start / end 為該月初一和最後一天的格里曆日期（不按範圍截斷）；
+    start 晚於 end 時返回空列表，與 festivals_between 一致
+    '''
+    check_year_range(start.year)
+    check_year_range(end.year)
+    if start > end:
+        return []
+    starts = MONTH_INDEX['start']
+    result = []
+    for i in range(bisect_right(starts, date2ordinal(start)) - 1,
+                   bisect_right(starts, date2ordinal(end))):
+        if i >= len(starts) - 1:
+            break
+        result.append({
+            'lunar_year': MONTH_INDEX['lunar_year'][i],
+            'lunar_month': MONTH_INDEX['lunar_month'][i],
+            'is_leap_month': bool(MONTH_INDEX['is_leap_month'][i]),
+            'start': ordinal2date(starts[i]),
+            'end': ordinal2date(starts[i+1] - 1),
+            'length': starts[i+1] - starts[i]
+        })
+    return result
+
+
+class LunarDate(object):
+    '''農曆日期（不可變），內部只保存日序數
+
+    可比較、可哈希，可與 datetime.timedelta 相加減，兩個 LunarDate 相減
+    得到 datetime.timedelta；年、月、日由 DAY_INDEX 查得
+    '''
+
+    __slots__ = ('ordinal',)
+
+    def __init__(self, year, lunar_month, lunar_date, is_leap_month=False):
+        '''
+        @param int year 農曆年
+        @param int lunar_month in range(1, 13)
+        @param int lunar_date in range(1, 31)
+        @param bool is_leap_month
+        '''
+        super(LunarDate, self).__setattr__('ordinal', zh_to_ordinal(
+            year, lunar_month, lunar_date, is_leap_month
+        ))
+
+    @classmethod
+    def from_ordinal(cls, ordinal):
+        '''@param int ordinal in range(0, DAY_COUNT)'''
+        if ordinal not in range(0, DAY_COUNT):
+            raise NotImplementedError('Out of data range')
+        result = cls.__new__(cls)
+        super(LunarDate, result).__setattr__('ordinal', ordinal)
+        return result
+
+    @classmethod
+    def from_gregorian(cls, date):
+        '''@param datetime.date date (1901/1/1 - 2049/12/31)'''
+        return cls.from_ordinal(date2ordinal(date))
+
+    @classmethod
+    def today(cls):
+        return cls.from_gregorian(datetime.datetime.now(tz).date())
+
+    def to_gregorian(self):
+        '''@return datetime.date'''
+        return ordinal2date(self.ordinal)
+
+    @property
+    def year(self):
+        return DAY_INDEX['lunar_year'][self.ordinal]
+
+    @property
+    def month(self):
+        return DAY_INDEX['lunar_month'][self.ordinal]
+
+    @property
+    def day(self):
+        return DAY_INDEX['lunar_date'][self.ordinal]
+
+    @property
+    def is_leap_month(self):
+        return bool(DAY_INDEX['is_leap_month'][self.ordinal])
+
+    def add_months(self, months):
+        '''前後移動若干個農曆月（閏月也算一個月），日期超出該月天數時取月末
+
+        @param int months
+        @return LunarDate
+        '''
+        starts = MONTH_INDEX['start']
+        i = bisect_right(starts, self.ordinal) - 1 + months
+        if i not in range(0, len(starts) - 1):
+            raise NotImplementedError('Out of data range')
+        length = starts[i+1] - starts[i]
+        return LunarDate.from_ordinal(
+            starts[i] + min(self.day, length) - 1
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError('LunarDate is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('LunarDate is immutable')
+
+    def __reduce__(self):
+        return (LunarDate.from_ordinal, (self.ordinal,))
+
+    def __hash__(self):
+        return hash(self.ordinal)
+
+    def __eq__(self, other):
+        if isinstance(other, LunarDate):
+            return self.ordinal == other.ordinal
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, LunarDate):
+            return self.ordinal != other.ordinal
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, LunarDate):
+            return self.ordinal < other.ordinal
+        return NotImplemented
+
+    def __le__(self, other):
+        if isinstance(other, LunarDate):
+            return self.ordinal <= other.ordinal
+        return NotImplemented
+
+    def __gt__(self, other):
+        if isinstance(other, LunarDate):
+            return self.ordinal > other.ordinal
+        return NotImplemented
+
+    def __ge__(self, other):
+        if isinstance(other, LunarDate):
+            return self.ordinal >= other.ordinal
+        return NotImplemented
+
+    def __add__(self, other):
+        if isinstance(other, datetime.timedelta):
+            return LunarDate.from_ordinal(self.ordinal + other.days)
+        return NotImplemented
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if isinstance(other, datetime.timedelta):
+            return LunarDate.from_ordinal(self.ordinal - other.days)
+        if isinstance(other, LunarDate):
+            return datetime.timedelta(self.ordinal - other.ordinal)
+        return NotImplemented
+
+    def __repr__(self):
+        if self.is_leap_month:
+            return 'LunarDate({0}, {1}, {2}, True)'.format(
+                self.year, self.month, self.day
+            )
+        return 'LunarDate({0}, {1}, {2})'.format(
+            self.year, self.month, self.day
+        )
+
+    def __str__(self):
+        return '{0}年{1}'.format(self.year, get_lunar_str(self.ordinal))
+
+
+# 閏月不存在時的處理：'regular' 改用同名的平月，'skip' 跳過當年
+MISSING_LEAP_RULES = ['regular', 'skip']
+# 日期超出當月天數（如小月三十）時的處理：'last' 改用月末，
+# 'next' 改用下月初一，'skip' 跳過當年
+MISSING_DAY_RULES = ['last', 'next', 'skip']
+
+
+def get_lunar_year_months(year):
+    '''返回農曆年 year 各月的初一日序數和天數
+
+    1901-2048 取自 MONTH_INDEX，其他年份使用天文算法（見 get_year_months）
+
+    @param int year
+    @return dict { (lunar_month, is_leap_month): tuple(start, length) }
+    '''
+    result = {}
+    if year in range(1901, 2049):
+        starts = MONTH_INDEX['start']
+        i = MONTH_LOOKUP[(year, 1, False)]
+        while i < len(starts) - 1 and MONTH_INDEX['lunar_year'][i] == year:
+            result[(
+                MONTH_INDEX['lunar_month'][i],
+                bool(MONTH_INDEX['is_leap_month'][i])
+            )] = (starts[i], starts[i+1] - starts[i])
+            i += 1
+        return result
+    for lunar_year, lunar_month, is_leap_month, start, length in \
+            get_year_months(year):
+        if lunar_year == year:
+            result[(lunar_month, is_leap_month)] = (start, length)
+    return result
+
+
+def resolve_lunar_event(months, lunar_month, lunar_date, is_leap_month,
+                        missing_leap='regular', missing_day='last'):
+    '''按回退規則求農曆 (月, 日, 閏) 在某年對應的日序數
+
+    @param dict months get_lunar_year_months() 的結果
+    @param int lunar_month
+    @param int lunar_date
+    @param bool is_leap_month
+    @param str missing_leap in MISSING_LEAP_RULES
+    @param str missing_day in MISSING_DAY_RULES
+    @return int or None 該年沒有對應日期時返回 None
+    '''
+    month = months.get((lunar_month, is_leap_month))
+    if month is None:
+        if not is_leap_month or missing_leap == 'skip':
+            return None
+        month = months[(lunar_month, False)]
+    start, length = month
+    if lunar_date > length:
+        if missing_day == 'last':
+            return start + length - 1
+        if missing_day == 'next':
+            return start + length
+        return None
+    return start + lunar_date - 1
+
+
+def expand_lunar_events(events, start, count=1, missing_leap='regular',
+                        missing_day='last', max_years=200):
+    '''批量展開每年重複的農曆事件（生日、忌日等）
+
+    事件按農曆 (月, 日, 閏) 分組，每組每年只求一次日期，
+    再依次輸出組內各事件，輸出順序為按組、組內保持輸入順序。
+    超出 1901-2049 的年份使用天文算法；超出其範圍或 max_years 時，
+    事件的日期可少於 count 個
+
+    @param iterable<tuple(user_id, lunar_month, lunar_date, is_leap_month)>
+        events
+    @param datetime.date start 只輸出此日及以後的日期
+    @param int count 每個事件輸出的日期數
+    @param str missing_leap in MISSING_LEAP_RULES
+    @param str missing_day in MISSING_DAY_RULES
+    @param int max_years 每組最多查找的農曆年數
+    @return generator<tuple(user_id, datetime.date)>
+    '''
+    if missing_leap not in MISSING_LEAP_RULES:
+        raise ValueError('Invalid missing_leap rule')
+    if missing_day not in MISSING_DAY_RULES:
+        raise ValueError('Invalid missing_day rule')
+    groups = {}
+    for user_id, lunar_month, lunar_date, is_leap_month in events:
+        key = (lunar_month, lunar_date, bool(is_leap_month))
+        users = groups.get(key)
+        if users is None:
+            if lunar_month not in range(1, 13):
+                raise ValueError('Invalid lunar month')
+            if lunar_date not in range(1, 31):
+                raise ValueError('Invalid lunar date')
+            users = groups[key] = []
+        users.append(user_id)
+
+    first_year = extended_gregorian_to_zh(start)['lunar_year']
+    begin = date2ordinal(start)
+    years = {}
+    for key, users in groups.items():
+        dates = []
+        year = first_year
+        while len(dates) < count and year < first_year + max_years:
+            months = years.get(year)
+            if months is None:
+                try:
+                    months = years[year] = get_lunar_year_months(year)
+                except NotImplementedError:
+                    break
+            ordinal = resolve_lunar_event(months, key[0], key[1], key[2],
+                                          missing_leap, missing_day)
+            if ordinal is not None and ordinal >= begin:
+                dates.append(ordinal2date(ordinal))
+            year += 1
+        for user_id in users:
+            for date in dates:
+                yield user_id, date
+
+
+NUMPY_TABLES = {}
+NUMPY_LOCK = _thread.allocate_lock()
+
+
+def get_numpy():
+    '''導入 NumPy（可選依賴），未安裝時返回 None
+
+    @return module or None
+    '''
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def get_numpy_tables(numpy):
+    '''返回 NumPy 形式的查詢表（首次調用時生成）
+
+    @param module numpy
+    @return dict {
+        lunar_year, lunar_month, lunar_date, is_leap_month,
+        month_start, month_length, year_pillar, month_pillar, day_pillar
+    }
+    month_start / month_length 以 ((年 - 1900) * 13 + 月) * 2 + 閏 為下標，
+    不存在的月份 month_start 為 -1
+    '''
+    if NUMPY_TABLES:
+        return NUMPY_TABLES
+    with NUMPY_LOCK:
+        if NUMPY_TABLES:
+            return NUMPY_TABLES
+        tables = {}
+        tables['lunar_year'] = numpy.frombuffer(
+            DAY_INDEX['lunar_year'], dtype=numpy.uint16
+        )
+        for key in ['lunar_month', 'lunar_date', 'is_leap_month']:
+            tables[key] = numpy.frombuffer(DAY_INDEX[key], dtype=numpy.uint8)
+        for key in ['year', 'month', 'day']:
+            tables[key + '_pillar'] = numpy.frombuffer(PILLAR_INDEX[key],
+                                                       dtype=numpy.uint8)
+        month_start = numpy.full(150 * 13 * 2, -1, dtype=numpy.int64)
+        month_length = numpy.zeros(150 * 13 * 2, dtype=numpy.int64)
+        starts = MONTH_INDEX['start']
+        for (year, month, is_leap), i in MONTH_LOOKUP.load().items():
+            key = ((year - 1900) * 13 + month) * 2 + is_leap
+            month_start[key] = starts[i]
+            month_length[key] = starts[i+1] - starts[i]
+        tables['month_start'] = month_start
+        tables['month_length'] = month_length
+        NUMPY_TABLES.update(tables)
+        return NUMPY_TABLES
+
+
+def gregorian_to_zh_many(dates):
+    '''批量格里曆轉農曆
+
+    安裝了 NumPy 時，dates 可以是 datetime64 數組或日序數（距 1901 年元旦的
+    天數）的整數數組，返回結構化數組；否則 dates 為 date object 或日序數的
+    可迭代對象，返回 list<tuple>
+
+    @param array-like dates (1901/1/1 - 2049/12/31)
+    @return numpy structured array {
+        lunar_year, lunar_month, lunar_date, is_leap_month
+    } or list<tuple(lunar_year, lunar_month, lunar_date, is_leap_month)>
+    '''
+    numpy = get_numpy()
+    if numpy is None:
+        result = []
+        for date in dates:
+            if isinstance(date, datetime.date):
+                ordinal = date2ordinal(date)
+            else:
+                ordinal = date
+            if ordinal not in range(0, DAY_COUNT):
+                raise NotImplementedError('Out of data range')
+            result.append((
+                DAY_INDEX['lunar_year'][ordinal],
+                DAY_INDEX['lunar_month'][ordinal],
+                DAY_INDEX['lunar_date'][ordinal],
+                bool(DAY_INDEX['is_leap_month'][ordinal])
+            ))
+        return result
+
+    tables = get_numpy_tables(numpy)
+    values = numpy.asarray(dates)
+    if values.dtype.kind in 'OM':
+        ordinals = (
+            values.astype('datetime64[D]').astype(numpy.int64)
+            - ORDINAL_ZERO_TS // DAY_SEC
+        )
+    else:
+        ordinals = values.astype(numpy.int64)
+    if ordinals.size and (ordinals.min() < 0 or ordinals.max() >= DAY_COUNT):
+        raise NotImplementedError('Out of data range')
+    result = numpy.empty(ordinals.shape, dtype=[
+        ('lunar_year', numpy.uint16),
+        ('lunar_month', numpy.uint8),
+        ('lunar_date', numpy.uint8),
+        ('is_leap_month', numpy.bool_)
+    ])
+    result['lunar_year'] = tables['lunar_year'][ordinals]
+    result['lunar_month'] = tables['lunar_month'][ordinals]
+    result['lunar_date'] = tables['lunar_date'][ordinals]
+    result['is_leap_month'] = tables['is_leap_month'][ordinals]
+    return result
+
+
+def zh_to_gregorian_many(years, lunar_months, lunar_dates, is_leap_months):
+    '''批量農曆轉格里曆
+
+    安裝了 NumPy 時參數為等長的數組，返回 datetime64[D] 數組；
+    否則參數為等長的可迭代對象，返回 list<datetime.date>
+
+    @param array-like years 農曆年 in range(1901, 2050)
+    @param array-like lunar_months in range(1, 13)
+    @param array-like lunar_dates in range(1, 31)
+    @param array-like is_leap_months
+    @return numpy.ndarray or list<datetime.date>
+    '''
+    numpy = get_numpy()
+    if numpy is None:
+        return [
+            zh_to_gregorian(*args) for args in
+            zip(years, lunar_months, lunar_dates, is_leap_months)
+        ]
+
+    tables = get_numpy_tables(numpy)
+    years = numpy.asarray(years, dtype=numpy.int64)
+    lunar_months = numpy.asarray(lunar_months, dtype=numpy.int64)
+    lunar_dates = numpy.asarray(lunar_dates, dtype=numpy.int64)
+    is_leap_months = numpy.asarray(is_leap_months, dtype=numpy.bool_)
+    if years.size and (years.min() < 1901 or years.max() > 2049):
+        raise NotImplementedError('Out of data range')
+    if lunar_months.size and (lunar_months.min() < 1
+                              or lunar_months.max() > 12):
+        raise ValueError('Invalid lunar month')
+    keys = ((years - 1900) * 13 + lunar_months) * 2 + is_leap_months
+    starts = tables['month_start'][keys]
+    if (starts < 0).any():
+        raise ValueError('No such leap month')
+    if ((lunar_dates < 1)
+            | (lunar_dates > tables['month_length'][keys])).any():
+        raise ValueError('Invalid lunar date')
+    ordinals = starts + lunar_dates - 1
+    if (ordinals >= DAY_COUNT).any():
+        raise NotImplementedError('Out of data range')
+    return (ordinals + ORDINAL_ZERO_TS // DAY_SEC).astype('datetime64[D]')
+
+
+# ts_to_zh_many 的輸出字段
+TS_FIELDS = ['ordinal', 'lunar_year', 'lunar_month', 'lunar_date',
+             'is_leap_month', 'hour', 'quarter', 'year_pillar',
+             'month_pillar', 'day_pillar', 'hour_pillar']
+
+
+def ts_to_zh(timestamp, utc_offset=8):
+    '''UNIX 時間戳轉農曆、時辰、刻和四柱
+
+    只用整數運算求出當地日序數和時刻，不構造 datetime object
+
+    @param int or float timestamp UNIX 時間戳（秒）
+    @param int or float or datetime.timedelta utc_offset 默認 UTC+8
+    @return dict {
+        ordinal, lunar_year, lunar_month, lunar_date, is_leap_month,
+        hour, quarter, year_pillar, month_pillar, day_pillar, hour_pillar
+    } hour 為時辰（地支索引），quarter 同 get_quarter，四柱為六十甲子索引
+    '''
+    ordinal, seconds = split_timestamp(math.floor(timestamp),
+                                       get_offset_seconds(utc_offset))
+    if ordinal not in range(0, DAY_COUNT):
+        raise NotImplementedError('Out of data range')
+    hour = seconds // 3600
+    day = PILLAR_INDEX['day'][ordinal]
+    return {
+        'ordinal': ordinal,
+        'lunar_year': DAY_INDEX['lunar_year'][ordinal],
+        'lunar_month': DAY_INDEX['lunar_month'][ordinal],
+        'lunar_date': DAY_INDEX['lunar_date'][ordinal],
+        'is_leap_month': bool(DAY_INDEX['is_leap_month'][ordinal]),
+        'hour': (hour + 1) // 2 % 12,
+        'quarter': 4 * ((hour + 1) % 2) + seconds % 3600 // 900,
+        'year_pillar': PILLAR_INDEX['year'][ordinal],
+        'month_pillar': PILLAR_INDEX['month'][ordinal],
+        'day_pillar': day,
+        'hour_pillar': (day % 5 * 12 + (hour + 1) // 2 % 12) % 60
+    }
+
+
+def ts_to_zh_many(timestamps, utc_offset=8):
+    '''批量 UNIX 時間戳轉農曆、時辰、刻和四柱
+
+    安裝了 NumPy 時 timestamps 可以是任意數字數組，返回結構化數組；
+    否則為數字的可迭代對象，返回 list<tuple>，字段順序同 TS_FIELDS
+
+    @param array-like timestamps UNIX 時間戳（秒）
+    @param int or float or datetime.timedelta utc_offset 默認 UTC+8
+    @return numpy structured array or list<tuple> 字段含義同 ts_to_zh
+    '''
+    offset = get_offset_seconds(utc_offset)
+    numpy = get_numpy()
+    if numpy is None:
+        lunar_years = DAY_INDEX['lunar_year']
+        lunar_months = DAY_INDEX['lunar_month']
+        lunar_dates = DAY_INDEX['lunar_date']
+        is_leap_months = DAY_INDEX['is_leap_month']
+        year_pillars = PILLAR_INDEX['year']
+        month_pillars = PILLAR_INDEX['month']
+        day_pillars = PILLAR_INDEX['day']
+        floor = math.floor
+        result = []
+        for timestamp in timestamps:
+            ordinal, seconds = split_timestamp(floor(timestamp), offset)
+            if ordinal < 0 or ordinal >= DAY_COUNT:
+                raise NotImplementedError('Out of data range')
+            hour = seconds // 3600 + 1
+            day = day_pillars[ordinal]
+            result.append((
+                ordinal, lunar_years[ordinal], lunar_months[ordinal],
+                lunar_dates[ordinal], bool(is_leap_months[ordinal]),
+                hour // 2 % 12, 4 * (hour % 2) + seconds % 3600 // 900,
+                year_pillars[ordinal], month_pillars[ordinal], day,
+                (day % 5 * 12 + hour // 2 % 12) % 60
+            ))
+        return result
+
+    tables = get_numpy_tables(numpy)
+    values = numpy.asarray(timestamps)
+    if values.dtype.kind == 'f':
+        values = numpy.floor(values)
+    ordinals, seconds = split_timestamp(values.astype(numpy.int64), offset)
+    if ordinals.size and (ordinals.min() < 0 or ordinals.max() >= DAY_COUNT):
+        raise NotImplementedError('Out of data range')
+    hours = seconds // 3600 + 1
+    result = numpy.empty(ordinals.shape, dtype=[
+        ('ordinal', numpy.int32),
+        ('lunar_year', numpy.uint16),
+        ('lunar_month', numpy.uint8),
+        ('lunar_date', numpy.uint8),
+        ('is_leap_month', numpy.bool_),
+        ('hour', numpy.uint8),
+        ('quarter', numpy.uint8),
+        ('year_pillar', numpy.uint8),
+        ('month_pillar', numpy.uint8),
+        ('day_pillar', numpy.uint8),
+        ('hour_pillar', numpy.uint8)
+    ])
+    result['ordinal'] = ordinals
+    for key in ['lunar_year', 'lunar_month', 'lunar_date', 'is_leap_month',
+                'year_pillar', 'month_pillar', 'day_pillar']:
+        result[key] = tables[key][ordinals]
+    result['hour'] = hours // 2 % 12
+    result['quarter'] = 4 * (hours % 2) + seconds % 3600 // 900
+    result['hour_pillar'] = (result['day_pillar'] % 5 * 12
+                             + result['hour']) % 60
+    return result
+
+
+# 天文算法的適用範圍（格里曆年）
+ASTRO_YEAR_RANGE = range(1000, 3001)
+# 推算 ASTRO_YEAR_RANGE 首尾兩年時還需要前後各一年的數據
+ASTRO_TABLE_RANGE = range(ASTRO_YEAR_RANGE.start - 1,
+                          ASTRO_YEAR_RANGE.stop + 1)
+# 此日（1929 年元旦）以前按北京地方平時（東經 116°25'）定朔、定氣，
+# 此後按東八區標準時
+ASTRO_STANDARD_TIME_START = date2ordinal(datetime.date(1929, 1, 1))
+# 天文算法結果的緩存目錄
+ASTRO_CACHE_DIR = os.environ.get('ZHCAL_ASTRO_CACHE', os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+    'zhcal'
+))
+# 算法改變時須遞增
+ASTRO_CACHE_VERSION = 2
+ASTRO_CACHE = {}
+ASTRO_LOCK = _thread.allocate_lock()
+# 地球日心黃經 VSOP87 級數（截斷，Meeus, Astronomical Algorithms, 附錄 III）
+# 每項為 (A, B, C)，A 的單位為 1e-8 弧度，值為 A cos(B + C τ)
+EARTH_L = [
+    [
+        (175347046, 0, 0), (3341656, 4.6692568, 6283.07585),
+        (34894, 4.6261, 12566.1517), (3497, 2.7441, 5753.3849),
+        (3418, 2.8289, 3.5231), (3136, 3.6277, 77713.7715),
+        (2676, 4.4181, 7860.4194), (2343, 6.1352, 3930.2097),
+        (1324, 0.7425, 11506.7698), (1273, 2.0371, 529.691),
+        (1199, 1.1096, 1577.3435), (990, 5.233, 5884.927),
+        (902, 2.045, 26.298), (857, 3.508, 398.149), (780, 1.179, 5223.694),
+        (753, 2.533, 5507.553), (505, 4.583, 18849.228),
+        (492, 4.205, 775.523), (357, 2.92, 0.067), (317, 5.849, 11790.629),
+        (284, 1.899, 796.298), (271, 0.315, 10977.079),
+        (243, 0.345, 5486.778), (206, 4.806, 2544.314),
+        (205, 1.869, 5573.143), (202, 2.458, 6069.777),
+        (156, 0.833, 213.299), (132, 3.411, 2942.463), (126, 1.083, 20.775),
+        (115, 0.645, 0.98), (103, 0.636, 4694.003), (102, 0.976, 15720.839),
+        (102, 4.267, 7.114), (99, 6.21, 2146.17), (98, 0.68, 155.42),
+        (86, 5.98, 161000.69), (85, 1.3, 6275.96), (85, 3.67, 71430.7),
+        (80, 1.81, 17260.15), (79, 3.04, 12036.46), (75, 1.76, 5088.63),
+        (74, 3.5, 3154.69), (74, 4.68, 801.82), (70, 0.83, 9437.76),
+        (62, 3.98, 8827.39), (61, 1.82, 7084.9), (57, 2.78, 6286.6),
+        (56, 4.39, 14143.5), (56, 3.47, 6279.55), (52, 0.19, 12139.55),
+        (52, 1.33, 1748.02), (51, 0.28, 5856.48), (49, 0.49, 1194.45),
+        (41, 5.37, 8429.24), (41, 2.4, 19651.05), (39, 6.17, 10447.39),
+        (37, 6.04, 10213.29), (37, 2.57, 1059.38), (36, 1.71, 2352.87),
+        (36, 1.78, 6812.77), (33, 0.59, 17789.85), (30, 0.44, 83996.85),
+        (30, 2.74, 1349.87), (25, 3.16, 4690.48)
+    ],
+    [
+        (628331966747, 0, 0), (206059, 2.678235, 6283.07585),
+        (4303, 2.6351, 12566.1517), (425, 1.59, 3.523),
+        (119, 5.796, 26.298), (109, 2.966, 1577.344), (93, 2.59, 18849.23),
+        (72, 1.14, 529.69), (68, 1.87, 398.15), (67, 4.41, 5507.55),
+        (59, 2.89, 5223.69), (56, 2.17, 155.42), (45, 0.4, 796.3),
+        (36, 0.47, 775.52), (29, 2.65, 7.11), (21, 5.34, 0.98),
+        (19, 1.85, 5486.78), (19, 4.97, 213.3), (17, 2.99, 6275.96),
+        (16, 0.03, 2544.31), (16, 1.43, 2146.17), (15, 1.21, 10977.08),
+        (12, 2.83, 1748.02), (12, 3.26, 5088.63), (12, 5.27, 1194.45),
+        (12, 2.08, 4694.0), (11, 0.77, 553.57), (10, 1.3, 6286.6),
+        (10, 4.24, 1349.87), (9, 2.7, 242.73), (9, 5.64, 951.72),
+        (8, 5.3, 2352.87), (6, 2.65, 9437.76), (6, 4.67, 4690.48)
+    ],
+    [
+        (52919, 0, 0), (8720, 1.0721, 6283.0758), (309, 0.867, 12566.152),
+        (27, 0.05, 3.52), (16, 5.19, 26.3), (16, 3.68, 155.42),
+        (10, 0.76, 18849.23), (9, 2.06, 77713.77), (7, 0.83, 775.52),
+        (5, 4.66, 1577.34), (4, 1.03, 7.11), (4, 3.44, 5573.14),
+        (3, 5.14, 796.3), (3, 6.05, 5507.55), (3, 1.19, 242.73),
+        (3, 6.12, 529.69), (3, 0.31, 398.15), (3, 2.28, 553.57),
+        (2, 4.38, 5223.69), (2, 3.75, 0.98)
+    ],
+    [
+        (289, 5.844, 6283.076), (35, 0, 0), (17, 5.49, 12566.15),
+        (3, 5.2, 155.42), (1, 4.72, 3.52), (1, 5.3, 18849.23),
+        (1, 5.97, 242.73)
+    ],
+    [(114, 3.142, 0), (8, 4.13, 6283.08), (1, 3.84, 12566.15)],
+    [(1, 3.14, 0)]
+]
+
+# 1901/1/1 00:00 UT 的儒略日
+JD_ORDINAL_ZERO = 2415385.5
+
+# 朔日修正項 (Meeus, Astronomical Algorithms, 49)
+# (係數, E 的次數, M, M', F, Ω 的倍數)
+NEW_MOON_TERMS = [
+    (-0.40720, 0, 0, 1, 0, 0),
+    (0.17241, 1, 1, 0, 0, 0),
+    (0.01608, 0, 0, 2, 0, 0),
+    (0.01039, 0, 0, 0, 2, 0),
+    (0.00739, 1, -1, 1, 0, 0),
+    (-0.00514, 1, 1, 1, 0, 0),
+    (0.00208, 2, 2, 0, 0, 0),
+    (-0.00111, 0, 0, 1, -2, 0),
+    (-0.00057, 0, 0, 1, 2, 0),
+    (0.00056, 1, 1, 2, 0, 0),
+    (-0.00042, 0, 0, 3, 0, 0),
+    (0.00042, 1, 1, 0, 2, 0),
+    (0.00038, 1, 1, 0, -2, 0),
+    (-0.00024, 1, -1, 2, 0, 0),
+    (-0.00017, 0, 0, 0, 0, 1),
+    (-0.00007, 0, 2, 1, 0, 0),
+    (0.00004, 0, 0, 2, -2, 0),
+    (0.00004, 0, 3, 0, 0, 0),
+    (0.00003, 0, 1, 1, -2, 0),
+    (0.00003, 0, 0, 2, 2, 0),
+    (-0.00003, 0, 1, 1, 2, 0),
+    (0.00003, 0, -1, 1, 2, 0),
+    (-0.00002, 0, -1, 1, -2, 0),
+    (-0.00002, 0, 1, 3, 0, 0),
+    (0.00002, 0, 0, 4, 0, 0)
+]
+# 行星攝動修正項：(係數, A 的常數項, A 的 k 係數)
+NEW_MOON_PLANETARY_TERMS = [
+    (0.000325, 299.77, 0.107408),
+    (0.000165, 251.88, 0.016321),
+    (0.000164, 251.83, 26.651886),
+    (0.000126, 349.42, 36.412478),
+    (0.000110, 84.66, 18.206239),
+    (0.000062, 141.74, 53.303771),
+    (0.000060, 207.14, 2.453732),
+    (0.000056, 154.84, 7.306860),
+    (0.000047, 34.52, 27.261239),
+    (0.000042, 207.19, 0.121824),
+    (0.000040, 291.34, 1.844379),
+    (0.000037, 161.72, 24.198154),
+    (0.000035, 239.56, 25.513099),
+    (0.000023, 331.55, 3.592518)
+]
+
+
+def get_delta_t(year):
+    '''估算 ΔT = TT - UT（秒）
+
+    Polynomial expressions by Espenak & Meeus (NASA)
+
+    @param float year 小數年
+    @return float
+    '''
+    y = year
+    if y < 500 or y >= 2150:
+        u = (y - 1820) / 100
+        return -20 + 32 * u * u
+    if y < 1600:
+        u = (y - 1000) / 100
+        return (1574.2 - 556.01 * u + 71.23472 * u**2 + 0.319781 * u**3
+                - 0.8503463 * u**4 - 0.005050998 * u**5
+                + 0.0083572073 * u**6)
+    if y < 1700:
+        t = y - 1600
+        return 120 - 0.9808 * t - 0.01532 * t**2 + t**3 / 7129
+    if y < 1800:
+        t = y - 1700
+        return (8.83 + 0.1603 * t - 0.0059285 * t**2 + 0.00013336 * t**3
+                - t**4 / 1174000)
+    if y < 1860:
+        t = y - 1800
+        return (13.72 - 0.332447 * t + 0.0068612 * t**2 + 0.0041116 * t**3
+                - 0.00037436 * t**4 + 0.0000121272 * t**5
+                - 0.0000001699 * t**6 + 0.000000000875 * t**7)
+    if y < 1900:
+        t = y - 1860
+        return (7.62 + 0.5737 * t - 0.251754 * t**2 + 0.01680668 * t**3
+                - 0.0004473624 * t**4 + t**5 / 233174)
+    if y < 1920:
+        t = y - 1900
+        return (-2.79 + 1.494119 * t - 0.0598939 * t**2 + 0.0061966 * t**3
+                - 0.000197 * t**4)
+    if y < 1941:
+        t = y - 1920
+        return 21.20 + 0.84493 * t - 0.076100 * t**2 + 0.0020936 * t**3
+    if y < 1961:
+        t = y - 1950
+        return 29.07 + 0.407 * t - t**2 / 233 + t**3 / 2547
+    if y < 1986:
+        t = y - 1975
+        return 45.45 + 1.067 * t - t**2 / 260 - t**3 / 718
+    if y < 2005:
+        t = y - 2000
+        return (63.86 + 0.3345 * t - 0.060374 * t**2 + 0.0017275 * t**3
+                + 0.000651814 * t**4 + 0.00002373599 * t**5)
+    if y < 2050:
+        t = y - 2000
+        return 62.92 + 0.32217 * t + 0.005589 * t**2
+    return -20 + 32 * ((y - 1820) / 100)**2 - 0.5628 * (2150 - y)
+
+
+def get_solar_longitude(jde):
+    '''太陽視黃經（度）
+
+    Algorithm from Meeus, Astronomical Algorithms, 25 (VSOP87)
+
+    @param float jde 儒略曆書日
+    @return float in [0, 360)
+    '''
+    tau = (jde - 2451545.0) / 365250
+    longitude = 0
+    for power, series in enumerate(EARTH_L):
+        longitude += sum(a * math.cos(b + c * tau)
+                         for a, b, c in series) * tau**power
+    t = tau * 10
+    # 地心黃經，轉換到 FK5
+    result = math.degrees(longitude / 1e8) + 180 - 0.09033 / 3600
+    # 章動（主要項）和光行差
+    omega = math.radians(125.04452 - 1934.136261 * t)
+    sun = math.radians(280.4665 + 36000.7698 * t)
+    moon = math.radians(218.3165 + 481267.8813 * t)
+    result += (-17.20 * math.sin(omega) - 1.32 * math.sin(2 * sun)
+               - 0.23 * math.sin(2 * moon) + 0.21 * math.sin(2 * omega)
+               - 20.4898) / 3600
+    return result % 360
+
+
+def get_new_moon(k):
+    '''第 k 個朔（k = 0 為 2000 年 1 月 6 日的朔）的時刻
+
+    Algorithm from Meeus, Astronomical Algorithms, 49
+
+    @param int k
+    @return float 儒略曆書日
+    '''
+    t = k / 1236.85
+    jde = (2451550.09766 + 29.530588861 * k + 0.00015437 * t**2
+           - 0.000000150 * t**3 + 0.00000000073 * t**4)
+    e = 1 - 0.002516 * t - 0.0000074 * t * t
+    m = math.radians(2.5534 + 29.10535670 * k - 0.0000014 * t**2
+                     - 0.00000011 * t**3)
+    mp = math.radians(201.5643 + 385.81693528 * k + 0.0107582 * t**2
+                      + 0.00001238 * t**3 - 0.000000058 * t**4)
+    f = math.radians(160.7108 + 390.67050284 * k - 0.0016118 * t**2
+                     - 0.00000227 * t**3 + 0.000000011 * t**4)
+    omega = math.radians(124.7746 - 1.56375588 * k + 0.0020672 * t**2
+                         + 0.00000215 * t**3)
+    for coefficient, power, a, b, c, d in NEW_MOON_TERMS:
+        jde += coefficient * e**power * math.sin(
+            a * m + b * mp + c * f + d * omega
+        )
+    for coefficient, base, rate in NEW_MOON_PLANETARY_TERMS:
+        angle = base + rate * k
+        if rate == 0.107408:
+            angle -= 0.009173 * t * t
+        jde += coefficient * math.sin(math.radians(angle))
+    return jde
+
+
+def jde2ordinal(jde, year):
+    '''將曆書時轉換為當地日序數
+
+    朔和節氣都經此換算，時區一律按 ASTRO_STANDARD_TIME_START 選擇；
+    兩者若用不同時區，中氣與朔的先後可能錯位，使閏月錯置
+
+    @param float jde
+    @param float year 大約年份，用於估算 ΔT
+    @return int
+    '''
+    days = jde - get_delta_t(year) / DAY_SEC - JD_ORDINAL_ZERO
+    if days + 8 / 24 < ASTRO_STANDARD_TIME_START:
+        return math.floor(days + (116 + 25 / 60) / 360)
+    return math.floor(days + 8 / 24)
+
+
+def get_solar_term_jde(index, year):
+    '''計算節氣時刻
+
+    @param int index in range(0, 24) 同 SOLAR_TERMS
+    @param int year 格里曆年
+    @return float 儒略曆書日
+    '''
+    longitude = (285 + 15 * index) % 360
+    # 由平氣估算，再用牛頓法迭代
+    jde = (JD_ORDINAL_ZERO + date2ordinal(datetime.date(year, 1, 1))
+           + 5.5 + 15.2184 * index)
+    for _ in range(0, 10):
+        delta = (longitude - get_solar_longitude(jde) + 180) % 360 - 180
+        jde += delta * 365.2422 / 360
+        if abs(delta) < 1e-8:
+            break
+    return jde
+
+
+def get_solar_term_ordinal(index, year):
+    '''@return int 節氣當日的日序數'''
+    return jde2ordinal(get_solar_term_jde(index, year), year)
+
+
+def compute_lunar_months(year):
+    '''按定朔、定氣和無中氣置閏規則，計算冬至所在月起的三個歲內的農曆月
+
+    @param int year 第一個歲起於 year - 2 年的冬至
+    @return list<tuple(lunar_year, lunar_month, is_leap_month, start, length)>
+    '''
+    solstices = [get_solar_term_ordinal(23, y)
+                 for y in range(year - 2, year + 2)]
+    principal = []
+    for y in range(year - 2, year + 2):
+        principal.extend(get_solar_term_ordinal(i, y) for i in range(1, 24, 2))
+    principal.sort()
+
+    first = get_solar_term_jde(23, year - 2) - 45
+    k = math.floor((first - 2451550.09766) / 29.530588861)
+    starts = []
+    while not starts or starts[-1] <= solstices[-1] + 30:
+        starts.append(jde2ordinal(get_new_moon(k), 2000 + k / 12.3685))
+        k += 1
+
+    result = []
+    for i in range(0, 3):
+        # 冬至所在月為十一月
+        begin = bisect_right(starts, solstices[i]) - 1
+        end = bisect_right(starts, solstices[i+1]) - 1
+        leap = end - begin == 13
+        lunar_year = year - 2 + i
+        month = 11
+        for j in range(begin, end):
+            is_leap = False
+            if j > begin:
+                # 閏年中第一個無中氣的月為閏月
+                if (leap and bisect_left(principal, starts[j])
+                        == bisect_left(principal, starts[j+1])):
+                    is_leap = True
+                    leap = False
+                else:
+                    month = month % 12 + 1
+                    if month == 1:
+                        lunar_year += 1
+            result.append((lunar_year, month, is_leap, starts[j],
+                           starts[j+1] - starts[j]))
+    return result
+
+
+def compute_year_tables(year):
+    '''以天文算法生成一年的數據，編碼與 LUNAR_MONTH_LENGTH、
+    LUNAR_DATE_OF_INITIAL_DAYS 相同
+
+    1645 年以前的曆法使用平氣，此處一律按現行規則推算
+
+    @param int year
+    @return dict {
+        year,
+        month_length: int 農曆年 year 的月長和閏月,
+        initial_day: int 格里曆年 year 元旦的農曆日期,
+        solar_terms: list<int> 24 個節氣在當月的日期
+    }
+    '''
+    months = compute_lunar_months(year)
+    month_length = 0
+    for lunar_year, month, is_leap, start, length in months:
+        if lunar_year == year:
+            if is_leap:
+                month_length |= month
+            elif length == 30:
+                month_length |= 0x10000 >> month
+        elif lunar_year == year - 1 and is_leap and length == 30:
+            if month_length & 0xf == 0:
+                month_length |= 0xf
+
+    new_year = date2ordinal(datetime.date(year, 1, 1))
+    initial_day = None
+    for lunar_year, month, is_leap, start, length in months:
+        if start <= new_year < start + length:
+            initial_day = [(11, False), (12, False), (11, True)].index(
+                (month, is_leap)
+            ) << 6 | (new_year - start + 1)
+    terms = []
+    for i in range(0, 24):
+        terms.append(ordinal2date(get_solar_term_ordinal(i, year)).day)
+    return {
+        'year': year,
+        'month_length': month_length,
+        'initial_day': initial_day,
+        'solar_terms': terms
+    }
+
+
+def get_year_tables(year):
+    '''返回一年的編碼數據：1900-2049 直接取自數據表，其他年份由天文算法
+    計算，並緩存於內存和 ASTRO_CACHE_DIR
+
+    @param int year in ASTRO_TABLE_RANGE
+    @return dict { year, month_length, initial_day, solar_terms }
+        見 compute_year_tables
+    '''
+    if year in range(1900, 2050):
+        return {
+            'year': year,
+            'month_length': LUNAR_MONTH_LENGTH[year-1900],
+            'initial_day': LUNAR_DATE_OF_INITIAL_DAYS[year-1900],
+            'solar_terms': [decode_solar_term_date(i, year).day
+                            for i in range(0, 24)]
+        }
+    if year not in ASTRO_TABLE_RANGE:
+        raise NotImplementedError('Out of data range')
+    result = ASTRO_CACHE.get(year)
+    if result is not None:
+        return result
+    with ASTRO_LOCK:
+        result = ASTRO_CACHE.get(year)
+        if result is None:
+            result = ASTRO_CACHE[year] = load_year_tables(year)
+    return result
+
+
+def load_year_tables(year):
+    '''從 ASTRO_CACHE_DIR 讀取一年的數據，沒有時計算並寫入
+
+    @param int year
+    @return dict 見 compute_year_tables
+    '''
+    import json
+    path = os.path.join(ASTRO_CACHE_DIR, 'astro-{0}.json'.format(year))
+    try:
+        with open(path) as f:
+            result = json.load(f)
+        if result.get('version') != ASTRO_CACHE_VERSION:
+            result = None
+    except (OSError, ValueError):
+        result = None
+    if result is None:
+        result = compute_year_tables(year)
+        result['version'] = ASTRO_CACHE_VERSION
+        try:
+            os.makedirs(ASTRO_CACHE_DIR, exist_ok=True)
+            temp = '{0}.{1}.tmp'.format(path, os.getpid())
+            with open(temp, 'w') as f:
+                json.dump(result, f)
+            os.replace(temp, path)
+        except OSError:
+            # 緩存目錄不可寫時只保留內存緩存
+            pass
+    del result['version']
+    return result
+
+
+YEAR_MONTHS_CACHE = LRUCache(16)
+
+
+def build_year_months(year):
+    '''列出從格里曆年 year 元旦所在的農曆月起，至農曆年 year 結束的各月
+
+    @param int year
+    @return tuple<tuple(lunar_year, lunar_month, is_leap_month, start,
+        length)> start 為初一的日序數
+    '''
+    previous = get_year_tables(year - 1)
+    current = get_year_tables(year)
+    following = get_year_tables(year + 1)
+    initial_month = current['initial_day'] >> 6
+    month, is_leap = [(11, False), (12, False), (11, True)][initial_month]
+    start = (date2ordinal(datetime.date(year, 1, 1))
+             - (current['initial_day'] & 0x3f) + 1)
+
+    months = []
+    leap = decode_leap_month(previous['month_length'])
+    for i in [11, 12]:
+        months.append((year - 1, i, False, decode_month_day_count(
+            previous['month_length'], current['month_length'], i
+        )))
+        if leap == i:
+            months.append((year - 1, i, True, decode_month_day_count(
+                previous['month_length'], current['month_length'], 0
+            )))
+    leap = decode_leap_month(current['month_length'])
+    for i in range(1, 13):
+        months.append((year, i, False, decode_month_day_count(
+            current['month_length'], following['month_length'], i
+        )))
+        if leap == i:
+            months.append((year, i, True, decode_month_day_count(
+                current['month_length'], following['month_length'], 0
+            )))
+
+    result = []
+    for lunar_year, lunar_month, is_leap_month, length in months:
+        if not result and (lunar_month, is_leap_month) != (month, is_leap):
+            continue
+        result.append((lunar_year, lunar_month, is_leap_month, start, length))
+        start += length
+    return tuple(result)
+
+
+def get_year_months(year):
+    '''返回 build_year_months(year)（結果緩存於 YEAR_MONTHS_CACHE）'''
+    return YEAR_MONTHS_CACHE.get(year, build_year_months)
+
+
+def extended_gregorian_to_zh(date):
+    '''格里曆轉農曆，1901-2049 以外的年份使用天文算法
+
+    @param datetime.date date 年份 in ASTRO_YEAR_RANGE
+    @return dict { lunar_year, lunar_month, lunar_date, is_leap_month,
+        timestamp }
+    '''
+    if date.year not in ASTRO_YEAR_RANGE:
+        raise NotImplementedError('Out of data range')
+    ordinal = date2ordinal(date)
+    if ordinal in range(0, DAY_COUNT):
+        result = gregorian_to_zh(date)
+        result['lunar_year'] = DAY_INDEX['lunar_year'][ordinal]
+        return result
+    for lunar_year, lunar_month, is_leap_month, start, length in \
+            get_year_months(date.year):
+        if ordinal < start + length:
+            return {
+                'lunar_year': lunar_year,
+                'lunar_month': lunar_month,
+                'lunar_date': ordinal - start + 1,
+                'is_leap_month': is_leap_month,
+                'timestamp': ORDINAL_ZERO_TS + ordinal * DAY_SEC
+            }
+
+
+def extended_zh_to_gregorian(year, lunar_month, lunar_date, is_leap_month):
+    '''農曆轉格里曆，1901-2049 以外的年份使用天文算法
+
+    @param int year 農曆年 in ASTRO_YEAR_RANGE
+    @param int lunar_month in range(1, 13)
+    @param int lunar_date in range(1, 31)
+    @param bool is_leap_month
+    @return datetime.date
+    '''
+    if year not in ASTRO_YEAR_RANGE:
+        raise NotImplementedError('Out of data range')
+    if year in range(1901, 2050):
+        try:
+            return zh_to_gregorian(year, lunar_month, lunar_date,
+                                   is_leap_month)
+        except NotImplementedError:
+            # 農曆 2049 年末已超出數據表
+            pass
+    if lunar_month not in range(1, 13):
+        raise ValueError('Invalid lunar month')
+    for month in get_year_months(year):
+        if month[:3] == (year, lunar_month, bool(is_leap_month)):
+            if lunar_date not in range(1, month[4] + 1):
+                raise ValueError('Invalid lunar date')
+            return ordinal2date(month[3] + lunar_date - 1)
+    if is_leap_month:
+        raise ValueError('No such leap month')
+    raise NotImplementedError('Out of data range')
+
+
+def extended_solar_term_date(index, year):
+    '''計算節氣日期，1901-2049 以外的年份使用天文算法
+
+    @param int index in range(0, 24)
+    @param int year in ASTRO_YEAR_RANGE
+    @return datetime.date
+    '''
+    if index not in range(0, 24):
+        raise ValueError('Invalid solar term index')
+    if year not in ASTRO_YEAR_RANGE:
+        raise NotImplementedError('Out of data range')
+    if year in range(1901, 2050):
+        return get_solar_term_date(index, year)
+    return datetime.date(year, index//2 + 1,
+                         get_year_tables(year)['solar_terms'][index])
+
+
+# 預先展開的數據文件，可由 `zhcal.py build-data` 生成
+DATA_FILE = os.environ.get('ZHCAL_DATA', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'zhcal.dat'
+))
+DATA_FILE_MAGIC = b'ZHCALDAT'
+# 展開算法改變時須遞增
+DATA_FILE_VERSION = 2
+# magic, version, source checksum, payload checksum, section count
+DATA_FILE_HEADER = struct.Struct('<8sIIII')
+# name, typecode, offset, count
+DATA_FILE_SECTION = struct.Struct('<32sc3xII')
+
+DATA_SOURCE = None
+DATA_MMAP = None
+DATA_TABLES = None
+DATA_LOCK = _thread.allocate_lock()
+
+
+def get_source_checksum():
+    '''返回源數據表的校驗和，用於判斷數據文件是否過期
+
+    @return int
+    '''
+    source = repr((
+        DATA_FILE_VERSION, LUNAR_DATE_OF_INITIAL_DAYS, LUNAR_MONTH_LENGTH,
+        SOLAR_TERM_BASE, SOLAR_TERM_INDEX, SOLAR_TERM_OFFSET
+    ))
+    return zlib.crc32(source.encode('utf-8'))
+
+
+def get_festival_checksum():
+    '''返回節日定義的校驗和，節日列表改變後數據文件中的節日索引不再使用
+
+    @return int
+    '''
+    source = repr((
+        [festival['date'] for festival in FESTIVALS],
+        [(festival['index'], festival['delta'])
+         for festival in SOLAR_FESTIVALS]
+    ))
+    return zlib.crc32(source.encode('utf-8'))
+
+
+def get_data_sections():
+    '''返回寫入數據文件的各列
+
+    @return list<tuple(str name, array)>
+    '''
+    sections = []
+    tables = [
+        ('month', MONTH_INDEX.load()),
+        ('day', DAY_INDEX.load()),
+        ('pillar', PILLAR_INDEX.load()),
+        ('festival', dict(zip(['ordinal', 'kind', 'festival'],
+                              get_festival_columns())))
+    ]
+    for prefix, table in tables:
+        for key in sorted(table):
+            sections.append((prefix + '.' + key, table[key]))
+    sections.append(
+        ('festival.checksum', array('I', [get_festival_checksum()]))
+    )
+    sections.append(('solar_term.ordinal', SOLAR_TERM_TABLE['ordinal']))
+    return sections
+
+
+def write_data_file(path):
+    '''將展開後的全部查詢表寫入數據文件
+
+    文件結構：文件頭、段表、8 字節對齊的各段數據（小端序）；
+    寫入臨時文件後原子替換，正在映射舊文件的進程不受影響
+
+    @param str path
+    '''
+    sections = []
+    for name, column in get_data_sections():
+        typecode = column.typecode if hasattr(column, 'typecode') \
+            else column.format
+        if typecode == 'l':
+            column = array('i', column)
+            typecode = 'i'
+        else:
+            column = array(typecode, column)
+        if sys.byteorder != 'little':
+            column.byteswap()
+        sections.append((name, typecode, column.tobytes(), len(column)))
+
+    offset = DATA_FILE_HEADER.size + DATA_FILE_SECTION.size * len(sections)
+    table = b''
+    payload = b''
+    for name, typecode, data, count in sections:
+        padding = -(offset + len(payload)) % 8
+        payload += b'\0' * padding
+        table += DATA_FILE_SECTION.pack(
+            name.encode('ascii'), typecode.encode('ascii'),
+            offset + len(payload), count
+        )
+        payload += data
+    body = table + payload
+    header = DATA_FILE_HEADER.pack(
+        DATA_FILE_MAGIC, DATA_FILE_VERSION, get_source_checksum(),
+        zlib.crc32(body), len(sections)
+    )
+    temp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(temp_path, 'wb') as f:
+        f.write(header)
+        f.write(body)
+    os.replace(temp_path, path)
+
+
+def load_data_file(path):
+    '''以 mmap 方式載入數據文件，各列為零拷貝的 memoryview
+
+    文件不存在、版本不符、源數據已改變或校驗失敗時返回 None
+
+    @param str path
+    @return tuple(mmap, dict { name: memoryview }) or None
+    '''
+    import mmap
+    if sys.byteorder != 'little':
+        return None
+    try:
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    view = memoryview(data)
+    try:
+        magic, version, source_checksum, checksum, count = \
+            DATA_FILE_HEADER.unpack_from(view)
+        if (magic != DATA_FILE_MAGIC or version != DATA_FILE_VERSION
+                or source_checksum != get_source_checksum()
+                or checksum != zlib.crc32(view[DATA_FILE_HEADER.size:])):
+            raise ValueError('Stale data file')
+        sections = {}
+        for i in range(0, count):
+            name, typecode, offset, length = DATA_FILE_SECTION.unpack_from(
+                view, DATA_FILE_HEADER.size + DATA_FILE_SECTION.size * i
+            )
+            typecode = typecode.decode('ascii')
+            size = struct.calcsize(typecode)
+            if offset % size or offset + length * size > len(view):
+                raise ValueError('Corrupt data file')
+            sections[name.rstrip(b'\0').decode('ascii')] = \
+                view[offset:offset + length * size].cast(typecode)
+    except (struct.error, ValueError, TypeError):
+        view.release()
+        data.close()
+        return None
+    return data, sections
+
+
+def get_data_tables():
+    '''返回數據文件中的各表（首次調用時映射文件），文件不可用時返回 {}
+
+    @return dict { name: dict { key: memoryview } }
+    '''
+    global DATA_SOURCE, DATA_MMAP, DATA_TABLES
+    if DATA_TABLES is not None:
+        return DATA_TABLES
+    with DATA_LOCK:
+        if DATA_TABLES is not None:
+            return DATA_TABLES
+        tables = {}
+        loaded = load_data_file(DATA_FILE)
+        if loaded is not None:
+            DATA_MMAP, sections = loaded
+            for name, column in sections.items():
+                prefix, key = name.split('.', 1)
+                tables.setdefault(prefix, {})[key] = column
+            festival = tables.get('festival', {})
+            if festival.pop('checksum', [None])[0] != get_festival_checksum():
+                tables.pop('festival', None)
+            DATA_SOURCE = DATA_FILE
+        else:
+            DATA_SOURCE = 'module'
+        DATA_TABLES = tables
+        return DATA_TABLES
+
+
+class LazyTable(dict):
+    '''首次訪問時才載入的查詢表
+
+    優先取數據文件中名為 name 的各列，否則調用 build() 生成；
+    載入以後與普通 dict 無異
+
+    線程安全：載入時加鎖並再次檢查，多個線程同時首次訪問也只生成一次；
+    各列生成完畢後才一次性放入，讀取已有的鍵不加鎖，
+    讀到尚未放入的鍵時經 __missing__ 等待載入完成
+    '''
+
+    def __init__(self, name, build):
+        super(LazyTable, self).__init__()
+        self.name = name
+        self.build = build
+        self.loaded = False
+        self.load_time = None
+        self.lock = _thread.allocate_lock()
+
+    def __missing__(self, key):
+        if self.loaded:
+            raise KeyError(key)
+        return self.load()[key]
+
+    def load(self):
+        '''確保已載入，返回自身
+
+        @return LazyTable
+        '''
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    start = time.perf_counter()
+                    tables = get_data_tables()
+                    if self.name in tables:
+                        self.update(tables[self.name])
+                    else:
+                        self.update(self.build())
+                    self.load_time = time.perf_counter() - start
+                    self.loaded = True
+        return self
+
+
+SOLAR_TERM_TABLE = LazyTable(
+    'solar_term', lambda: {'ordinal': build_solar_term_index()}
+)
+MONTH_INDEX = LazyTable('month', build_month_index)
+DAY_INDEX = LazyTable('day', lambda: build_day_index(MONTH_INDEX))
+MONTH_LOOKUP = LazyTable('month_lookup',
+                         lambda: build_month_lookup(MONTH_INDEX))
+PILLAR_INDEX = LazyTable('pillar', build_pillar_index)
+FESTIVAL_INDEX = LazyTable('festival', build_festival_index)
+LAZY_TABLES = [SOLAR_TERM_TABLE, MONTH_INDEX, DAY_INDEX, MONTH_LOOKUP,
+               PILLAR_INDEX, FESTIVAL_INDEX]
+
+
+def inverse_color(string):
+    return '\033[7m' + string + '\033[0m'
+
+
+def num_prepend_blank(num):
+    result = str(num)
+    if len(result) < 2:
+        result = ' ' + result
+    return result
+
+
+def print_datetime(date_time):
+    check_datetime_range(date_time)
+    date = date_time.date()
+    time = date_time.time()
+    # 只查一天：直接解碼，不生成整張查詢表
+    lunar_year, lunar_month, lunar_date, is_leap_month = decode_lunar_day(date)
+    pillars = decode_four_pillars(date, date_time.hour)
+    lunar_month_prefix = ''
+    if is_leap_month:
+        lunar_month_prefix = '閏'
+    print(
+'''
+西元 %(year)d 年 %(month)d 月 %(day)d 日  週%(weekday)s
+農曆 %(lunar_month)s月%(lunar_date)s  生肖：%(zodiac)s
+四柱 %(year_cycle)s年  %(month_cycle)s月  %(day_cycle)s日  %(hour_cycle)s時
+時間 東八區 %(hour)d 時 %(minute)d 分 %(second)d 秒  %(c_quarter)s刻
+''' % {
+    'year': date.year,
+    'month': date.month,
+    'day': date.day,
+    'weekday': WEEKDAYS[date.weekday()],
+    'lunar_month': lunar_month_prefix + LUNAR_MONTHS[lunar_month],
+    'lunar_date': get_lunar_date_str(lunar_date),
+    # 生肖以正月初一為界，即農曆年的地支
+    'zodiac': ZODIAC[get_year_cycle_index_approx(lunar_year) % 12],
+    'year_cycle': CYCLE_60[pillars[0]],
+    'month_cycle': CYCLE_60[pillars[1]],
+    'day_cycle': CYCLE_60[pillars[2]],
+    'hour_cycle': CYCLE_60[pillars[3]],
+    'hour': date_time.hour,
+    'minute': date_time.minute,
+    'second': date_time.second,
+    'c_quarter': QUARTERS[get_quarter(time)]
+      }
+    )
+
+
+def print_info(args):
+    print_datetime(datetime.datetime(args.year, args.month, args.day,
+                                     args.hour, args.m, 0, tzinfo=tz))
+
+
+def print_now(args):
+    if args.watch:
+        try:
+            print_watch()
+        except KeyboardInterrupt:
+            pass
+    else:
+        print_datetime(datetime.datetime.now(tz))
+
+
+# now --watch 顯示的各行
+WATCH_LINES = [
+    '西元 {date}',
+    '農曆 {lunar}  生肖：{zodiac}  節氣：{solar_term}',
+    '四柱 {year_pillar}年  {month_pillar}月  {day_pillar}日  {hour_pillar}時',
+    '時間 東八區 {hour}時  {quarter}刻'
+]
+
+# 刻的長度（秒）。時辰、日期、農曆月和節氣的變化都落在刻的邊界上，
+# 東八區與 UTC 相差整刻，因此下一次變化總在下一個整刻
+QUARTER_SEC = 900
+
+
+def get_watch_day_fields(ordinal):
+    '''返回 now --watch 中一日之內不變的字段
+
+    @param int ordinal in range(0, DAY_COUNT)
+    @return dict {
+        date, lunar, zodiac, solar_term, year_pillar, month_pillar, day_pillar
+    } of str
+    '''
+    date = ordinal2date(ordinal)
+    lunar_month_prefix = ''
+    if DAY_INDEX['is_leap_month'][ordinal]:
+        lunar_month_prefix = '閏'
+    # 1901 年小寒以前屬於 1900 年冬至
+    position = bisect_right(SOLAR_TERM_TABLE['ordinal'], ordinal) - 1
+    return {
+        'date': '{0} 年 {1} 月 {2} 日  週{3}'.format(
+            date.year, date.month, date.day, WEEKDAYS[date.weekday()]
+        ),
+        'lunar': (lunar_month_prefix
+                  + LUNAR_MONTHS[DAY_INDEX['lunar_month'][ordinal]] + '月'
+                  + get_lunar_date_str(DAY_INDEX['lunar_date'][ordinal])),
+        'zodiac': ZODIAC[get_zodiac(date)],
+        'solar_term': SOLAR_TERMS[position % 24],
+        'year_pillar': CYCLE_60[PILLAR_INDEX['year'][ordinal]],
+        'month_pillar': CYCLE_60[PILLAR_INDEX['month'][ordinal]],
+        'day_pillar': CYCLE_60[PILLAR_INDEX['day'][ordinal]]
+    }
+
+
+def watch_now(clock=time.time, sleep=time.sleep):
+    '''持續生成當前時間（UTC+8）各顯示字段的變化
+
+    首次生成全部字段，之後睡眠到下一個整刻再醒來，只生成有變化的字段；
+    日期變化時才重新查詢日級字段
+
+    @param callable clock 返回 UNIX 時間戳
+    @param callable sleep 參數為秒數
+    @return generator<tuple(int timestamp, dict { field: str })>
+        field 見 WATCH_LINES
+    '''
+    fields = {}
+    ordinal = None
+    while True:
+        timestamp = math.floor(clock())
+        current = ts_to_zh(timestamp)
+        changes = {}
+        if current['ordinal'] != ordinal:
+            ordinal = current['ordinal']
+            changes.update(get_watch_day_fields(ordinal))
+        changes['hour_pillar'] = CYCLE_60[current['hour_pillar']]
+        changes['hour'] = CYCLE_12[current['hour']]
+        changes['quarter'] = QUARTERS[current['quarter']]
+        for field in list(changes):
+            if fields.get(field) == changes[field]:
+                del changes[field]
+        if changes:
+            fields.update(changes)
+            yield timestamp, changes
+        delay = (timestamp // QUARTER_SEC + 1) * QUARTER_SEC - clock()
+        if delay > 0:
+            sleep(delay)
+
+
+def print_watch():
+    '''按 watch_now 持續輸出當前時間
+
+    輸出到終端時原地改寫有變化的行，否則每次變化輸出一行 JSON
+    '''
+    import json
+    interactive = sys.stdout.isatty()
+    lines = None
+    for timestamp, changes in watch_now():
+        if not interactive:
+            changes['timestamp'] = timestamp
+            print(json.dumps(changes, ensure_ascii=False), flush=True)
+            continue
+        if lines is None:
+            fields = changes
+            lines = [line.format(**fields) for line in WATCH_LINES]
+            print('\n'.join(lines), flush=True)
+            continue
+        fields.update(changes)
+        output = []
+        for i in range(0, len(lines)):
+            line = WATCH_LINES[i].format(**fields)
+            if line != lines[i]:
+                lines[i] = line
+                # 上移到該行，清除後改寫，再回到末尾
+                up = len(lines) - i
+                output.append('\033[{0}A\r\033[2K{1}\033[{0}B\r'.format(
+                    up, line
+                ))
+        sys.stdout.write(''.join(output))
+        sys.stdout.flush()
+
+
+def print_festivals(year):
+    check_year_range(year)
+    festivals = get_festivals_date(year)
+    for festival in festivals:
+        print('{0} {1}月{2}  {3} 月 {4} 日  週{5}'.format(
+            festival['name'],
+            LUNAR_MONTHS[festival['lunar_date'][0]],
+            get_lunar_date_str(festival['lunar_date'][1]),
+            num_prepend_blank(festival['date'].month),
+            num_prepend_blank(festival['date'].day),
+            WEEKDAYS[festival['date'].weekday()]
+        ))
+    print('')
+    for festival in festivals_between(datetime.date(year, 1, 1),
+                                      datetime.date(year, 12, 31)):
+        if festival['type'] != 'solar':
+            continue
+        print('{0} {1} 月 {2} 日  週{3}'.format(
+            festival['name'],
+            num_prepend_blank(festival['date'].month),
+            num_prepend_blank(festival['date'].day),
+            WEEKDAYS[festival['date'].weekday()]
+        ))
+
+
+GRID_CACHE = LRUCache(64)
+# 全部 LRU 緩存，供統計輸出使用
+CACHES = {
+    'calendar': CALENDAR_CACHE,
+    'year_months': YEAR_MONTHS_CACHE,
+    'grid': GRID_CACHE
+}
+# 月曆每格的顯示寬度
+CELL_WIDTH = 9
+MONTH_WIDTH = CELL_WIDTH * 7
+
+
+def build_month_grid(key):
+    '''生成月曆網格（見 month_grid）
+
+    @param tuple(year, month, first_weekday) key
+    @return tuple<tuple<mappingproxy or None>>
+    '''
+    from types import MappingProxyType
+    year, month, first_weekday = key
+    first = datetime.date(year, month, 1)
+    if month == 12:
+        last = datetime.date(year, 12, 31)
+    else:
+        last = datetime.date(year, month + 1, 1) - datetime.timedelta(1)
+    begin = date2ordinal(first)
+
+    terms = {}
+    for i in [(month - 1)*2, (month - 1)*2 + 1]:
+        terms[SOLAR_TERM_TABLE['ordinal'][(year-1901)*24 + i]] = SOLAR_TERMS[i]
+    festivals = {}
+    for festival in festivals_between(first, last):
+        if festival['type'] == 'lunar':
+            festivals.setdefault(date2ordinal(festival['date']),
+                                 festival['name'])
+
+    cells = [None] * ((first.weekday() - first_weekday) % 7)
+    for ordinal in range(begin, begin + last.day):
+        lunar_month = DAY_INDEX['lunar_month'][ordinal]
+        lunar_date = DAY_INDEX['lunar_date'][ordinal]
+        is_leap_month = bool(DAY_INDEX['is_leap_month'][ordinal])
+        festival = festivals.get(ordinal)
+        solar_term = terms.get(ordinal)
+        if festival:
+            label = festival
+        elif solar_term:
+            label = solar_term
+        elif lunar_date == 1:
+            if is_leap_month:
+                label = '閏' + LUNAR_MONTHS[lunar_month]
+            else:
+                label = LUNAR_MONTHS[lunar_month] + '月'
+        else:
+            label = get_lunar_date_str(lunar_date)
+        cells.append(MappingProxyType({
+            'date': ordinal2date(ordinal),
+            'day': ordinal - begin + 1,
+            'lunar_month': lunar_month,
+            'lunar_date': lunar_date,
+            'is_leap_month': is_leap_month,
+            'festival': festival,
+            'solar_term': solar_term,
+            'label': label
+        }))
+    cells += [None] * (-len(cells) % 7)
+    return tuple(tuple(cells[i:i+7]) for i in range(0, len(cells), 7))
+
+
+def month_grid(year, month, first_weekday=0):
+    '''返回月曆網格（結果緩存於 GRID_CACHE，不可修改）
+
+    @param int year in range(1901, 2050)
+    @param int month in range(1, 13)
+    @param int first_weekday 每週第一天 (0=Monday)
+    @return tuple<tuple<cell>> 每週一行，每行 7 格，不屬於本月的格為 None；
+        cell 為只讀的 dict { date, day, lunar_month, lunar_date,
+        is_leap_month, festival, solar_term, label }
+    '''
+    check_year_range(year)
+    if month not in range(1, 13):
+        raise ValueError('Invalid month')
+    return GRID_CACHE.get((year, month, first_weekday % 7), build_month_grid)
+
+
+def display_width(text):
+    '''返回字符串在終端的顯示寬度（全角字符計 2，忽略反色控制碼）
+
+    @param str text
+    @return int
+    '''
+    import unicodedata
+    text = text.replace('\033[7m', '').replace('\033[0m', '')
+    width = 0
+    for char in text:
+        if unicodedata.east_asian_width(char) in 'WF':
+            width += 2
+        else:
+            width += 1
+    return width
+
+
+def render_month(year, month, first_weekday, today=None, pad=False):
+    '''將月曆渲染為文本行
+
+    @param int year in range(1901, 2050)
+    @param int month in range(1, 13)
+    @param int first_weekday (0=Monday)
+    @param datetime.date today 反色顯示的日期
+    @param bool pad 將每行補足到相同顯示寬度（用於並排輸出）
+    @return list<str>
+    '''
+    title = MONTHS[month] + '月 ' + str(year)
+    if pad:
+        left = (MONTH_WIDTH - display_width(title)) // 2
+        title = ' ' * left + title
+    else:
+        title = '{:^63}'.format(title)
+    lines = [title, '', ''.join(
+        '   週{0}  '.format(WEEKDAYS[(i+first_weekday) % 7])
+        for i in range(0, 7)
+    ), '']
+    for week in month_grid(year, month, first_weekday):
+        week = list(week)
+        if not pad:
+            while week[-1] is None:
+                week.pop()
+        line = ''
+        for cell in week:
+            if cell is None:
+                line += ' ' * CELL_WIDTH
+            elif cell['date'] == today:
+                line += inverse_color('{0} {1}'.format(
+                    num_prepend_blank(cell['day']), cell['label']
+                ))
+                line += '  '
+            else:
+                line += '{0} {1}  '.format(num_prepend_blank(cell['day']),
+                                           cell['label'])
+        lines.append(line)
+    if pad:
+        lines = [
+            line + ' ' * (MONTH_WIDTH - display_width(line))
+            for line in lines
+        ]
+    return lines
+
+
+def render_full_year(year, first_weekday, columns=1, today=None):
+    '''將全年月曆渲染為文本行
+
+    @param int year in range(1901, 2050)
+    @param int first_weekday (0=Monday)
+    @param int columns 每行並排的月數
+    @param datetime.date today
+    @return list<str>
+    '''
+    lines = []
+    if columns <= 1:
+        for month in range(1, 13):
+            lines += render_month(year, month, first_weekday, today)
+            lines.append('')
+        return lines
+    for row in range(1, 13, columns):
+        months = [
+            render_month(year, month, first_weekday, today, pad=True)
+            for month in range(row, min(row + columns, 13))
+        ]
+        height = max(len(month) for month in months)
+        for i in range(0, height):
+            lines.append(' '.join(
+                month[i] if i < len(month) else ' ' * MONTH_WIDTH
+                for month in months
+            ).rstrip())
+        lines.append('')
+    return lines
+
+
+def print_calendar(year, month, first_weekday):
+    check_year_range(year)
+    lines = render_month(year, month, first_weekday,
+                         datetime.datetime.now(tz).date())
+    sys.stdout.write('\n'.join(lines) + '\n')
+
+
+def print_full_year(year, first_weekday, columns=1):
+    check_year_range(year)
+    lines = render_full_year(year, first_weekday, columns,
+                             datetime.datetime.now(tz).date())
+    sys.stdout.write('\n'.join(lines) + '\n')
+
+
+CONVERT_FIELDS = ['input', 'lunar_year', 'lunar_month', 'lunar_date',
+                  'is_leap_month', 'zodiac', 'year_pillar', 'month_pillar',
+                  'day_pillar', 'hour_pillar']
+CONVERT_CHUNK_SIZE = 4096
+
+
+def parse_convert_input(text):
+    '''解析一行日期或日期時間，日期與時間以 'T' 或空格分隔
+
+    日期為 YYYY-MM-DD（月、日可不補零）或 YYYYMMDD，時間為 ISO 8601
+    時間（小時可不補零），可帶時區
+
+    @param str text e.g. '2015-01-01', '2015-1-1 8:30' or
+        '2015-01-01T08:30+00:00'
+    @return tuple(datetime.datetime, bool has_time)
+    '''
+    date_part, time_part = text, None
+    for separator in ['T', ' ']:
+        if separator in text:
+            date_part, time_part = text.split(separator, 1)
+            break
+    if '-' in date_part:
+        try:
+            date = datetime.date(*[int(x) for x in date_part.split('-')])
+        except TypeError:
+            raise ValueError('Invalid date: {0!r}'.format(date_part))
+    else:
+        date = datetime.date.fromisoformat(date_part)
+    if time_part is None:
+        return datetime.datetime.combine(date, datetime.time()), False
+    time_part = time_part.strip()
+    if time_part[1:2] == ':':
+        time_part = '0' + time_part
+    return (datetime.datetime.combine(
+        date, datetime.time.fromisoformat(time_part)
+    ), True)
+
+
+def convert_record(text):
+    '''將一行日期或日期時間（ISO 8601）轉換為農曆、生肖和四柱
+
+    無時區信息時視為 UTC+8 時間；只有日期時 hour_pillar 為 None
+
+    @param str text e.g. '2015-01-01' or '2015-01-01 08:30'
+    @return dict { CONVERT_FIELDS }
+    '''
+    text = text.strip()
+    date_time, has_time = parse_convert_input(text)
+    if date_time.tzinfo is not None:
+        date_time = date_time.astimezone(tz)
+    ordinal = date2ordinal(date_time.date())
+    pillars = get_pillars_by_ordinal(ordinal, date_time.hour)
+    lunar_year = DAY_INDEX['lunar_year'][ordinal]
+    return {
+        'input': text,
+        'lunar_year': lunar_year,
+        'lunar_month': DAY_INDEX['lunar_month'][ordinal],
+        'lunar_date': DAY_INDEX['lunar_date'][ordinal],
+        'is_leap_month': bool(DAY_INDEX['is_leap_month'][ordinal]),
+        'zodiac': ZODIAC[get_year_cycle_index_approx(lunar_year) % 12],
+        'year_pillar': CYCLE_60[pillars[0]],
+        'month_pillar': CYCLE_60[pillars[1]],
+        'day_pillar': CYCLE_60[pillars[2]],
+        'hour_pillar': CYCLE_60[pillars[3]] if has_time else None
+    }
+
+
+def convert_chunk(chunk):
+    '''轉換一批輸入行並格式化輸出（可在工作進程中執行）
+
+    @param tuple(int first_line_number, list<str> lines, str output_format)
+    @return tuple(str output, list<str> errors)
+    '''
+    line_number, lines, output_format = chunk
+    records = []
+    errors = []
+    for line in lines:
+        if line.strip():
+            try:
+                records.append(convert_record(line))
+            except (ValueError, NotImplementedError) as e:
+                errors.append('line {0}: {1}'.format(line_number, e))
+        line_number += 1
+    import io
+    buf = io.StringIO()
+    if output_format == 'csv':
+        import csv
+        writer = csv.writer(buf, lineterminator='\n')
+        for record in records:
+            writer.writerow([
+                '' if record[field] is None else record[field]
+                for field in CONVERT_FIELDS
+            ])
+    else:
+        import json
+        for record in records:
+            buf.write(json.dumps(record, ensure_ascii=False))
+            buf.write('\n')
+    return buf.getvalue(), errors
+
+
+def iter_chunks(lines, output_format):
+    '''將輸入行分批（每批 CONVERT_CHUNK_SIZE 行）
+
+    @param iterable<str> lines
+    @param str output_format
+    @return generator<tuple(int, list<str>, str)>
+    '''
+    chunk = []
+    line_number = 1
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == CONVERT_CHUNK_SIZE:
+            yield line_number, chunk, output_format
+            line_number += len(chunk)
+            chunk = []
+    if chunk:
+        yield line_number, chunk, output_format
+
+
+def convert_stream(lines, output, output_format='jsonl', workers=1):
+    '''逐批轉換輸入行並寫入 output，內存佔用與輸入大小無關
+
+    @param iterable<str> lines
+    @param file output
+    @param str output_format 'jsonl' or 'csv'
+    @param int workers 工作進程數，1 表示在當前進程中轉換
+    @return list<str> errors
+    '''
+    all_errors = []
+
+    def write(result):
+        output.write(result[0])
+        all_errors.extend(result[1])
+
+    if output_format == 'csv':
+        output.write(','.join(CONVERT_FIELDS) + '\n')
+    chunks = iter_chunks(lines, output_format)
+    if workers <= 1:
+        for chunk in chunks:
+            write(convert_chunk(chunk))
+        return all_errors
+
+    from collections import deque
+    from multiprocessing import Pool
+    pending = deque()
+    with Pool(workers) as pool:
+        for chunk in chunks:
+            # 限制在途批次數量，避免一次讀入整個文件
+            if len(pending) >= workers * 2:
+                write(pending.popleft().get())
+            pending.append(pool.apply_async(convert_chunk, (chunk,)))
+        while pending:
+            write(pending.popleft().get())
+    return all_errors
+
+
+def print_convert(args):
+    if args.file == '-':
+        errors = convert_stream(sys.stdin, sys.stdout, args.format,
+                                args.workers)
+    else:
+        with open(args.file, encoding='utf-8') as f:
+            errors = convert_stream(f, sys.stdout, args.format, args.workers)
+    sys.stdout.flush()
+    for error in errors:
+        print(error, file=sys.stderr)
+    if errors:
+        sys.exit(1)
+
+
+def parse_pillar(value):
+    '''將干支名稱或六十甲子索引轉換為索引
+
+    @param str or int or None value e.g. '甲子' or 0
+    @return int or None
+    '''
+    if value is None or isinstance(value, int):
+        if value is not None and value not in range(0, 60):
+            raise ValueError('Invalid pillar')
+        return value
+    if value not in CYCLE_60:
+        raise ValueError('Invalid pillar')
+    return CYCLE_60.index(value)
+
+
+def iter_pillar_segments(bounds, first, target, begin, end):
+    '''生成柱值等於 target 的各時段與 [begin, end) 的交集
+
+    第 i 段為 [bounds[i], bounds[i+1])，柱值為 (first + i) % 60，
+    故相符的時段每隔 60 段出現一次
+
+    @param list<int> bounds 各段的起點日序數，末尾為結束標記
+    @param int first 第 0 段的柱值
+    @param int or None target None 表示不限
+    @param int begin
+    @param int end
+    @return generator<tuple(int, int)>
+    '''
+    if target is None:
+        if begin < end:
+            yield begin, end
+        return
+    i = max(bisect_right(bounds, begin) - 1, 0)
+    i += (target - first - i) % 60
+    while i < len(bounds) - 1 and bounds[i] < end:
+        low = max(bounds[i], begin)
+        high = min(bounds[i+1], end)
+        if low < high:
+            yield low, high
+        i += 60
+
+
+def intersect_segments(a, b):
+    '''求兩個有序區間序列的交集
+
+    @param iterator<tuple(int, int)> a
+    @param iterator<tuple(int, int)> b
+    @return generator<tuple(int, int)>
+    '''
+    x = next(a, None)
+    y = next(b, None)
+    while x is not None and y is not None:
+        low = max(x[0], y[0])
+        high = min(x[1], y[1])
+        if low < high:
+            yield low, high
+        if x[1] < y[1]:
+            x = next(a, None)
+        else:
+            y = next(b, None)
+
+
+def find_pillars(start, end, year=None, month=None, day=None, hour=None):
+    '''按時間順序逐個生成 [start, end] 內四柱符合條件的日期或時辰
+
+    日柱以 60 日為周期，月柱、年柱分別在節和立春處改變，
+    因此直接跳到相符的時段和日期，不逐日檢查。
+    各柱可為干支名稱、六十甲子索引或 None（不限）
+
+    @param datetime.date start
+    @param datetime.date end
+    @param str or int year
+    @param str or int month
+    @param str or int day
+    @param str or int hour
+    @return generator<datetime.date> 不限時柱時;
+        generator<datetime.datetime> 指定時柱時，為各相符時辰的開始時刻
+        （子時分屬當日 0 時和 23 時兩段）
+    '''
+    year = parse_pillar(year)
+    month = parse_pillar(month)
+    day = parse_pillar(day)
+    hour = parse_pillar(hour)
+    begin = max(date2ordinal(start), 0)
+    end = min(date2ordinal(end) + 1, DAY_COUNT)
+    terms = SOLAR_TERM_TABLE['ordinal']
+
+    # 以立春為界
+    year_bounds = [0] + list(terms[2::24]) + [DAY_COUNT]
+    # 以節為界
+    month_bounds = [0] + list(terms[0::2]) + [DAY_COUNT]
+    segments = intersect_segments(
+        iter_pillar_segments(year_bounds, PILLAR_INDEX['year'][0], year,
+                             begin, end),
+        iter_pillar_segments(month_bounds, PILLAR_INDEX['month'][0], month,
+                             begin, end)
+    )
+
+    day_zero = PILLAR_INDEX['day'][0]
+    if hour is None:
+        step = 1
+    else:
+        # 時干由日干推出：時柱 = (日柱 % 5 * 12 + 時辰) % 60
+        branch = hour % 12
+        stem_group = (hour - branch) // 12 % 5
+        step = 5
+    if day is not None:
+        if hour is not None and day % 5 != stem_group:
+            return
+        step = 60
+
+    for low, high in segments:
+        if day is not None:
+            ordinal = low + (day - day_zero - low) % 60
+        elif hour is not None:
+            ordinal = low + (stem_group - day_zero - low) % 5
+        else:
+            ordinal = low
+        while ordinal < high:
+            date = ordinal2date(ordinal)
+            if hour is None:
+                yield date
+            elif branch == 0:
+                yield datetime.datetime(date.year, date.month, date.day,
+                                        tzinfo=tz)
+                yield datetime.datetime(date.year, date.month, date.day, 23,
+                                        tzinfo=tz)
+            else:
+                yield datetime.datetime(date.year, date.month, date.day,
+                                        branch * 2 - 1, tzinfo=tz)
+            ordinal += step
+
+
+def print_search(args):
+    start = parse_date_arg(args.start)
+    end = parse_date_arg(args.end or args.start, True)
+    lines = []
+    for value in find_pillars(start, end, args.y, args.m, args.d, args.H):
+        if isinstance(value, datetime.datetime):
+            pillars = get_four_pillars(value)
+            lines.append('{0}  {1}年 {2}月 {3}日 {4}時'.format(
+                value.strftime('%Y-%m-%d %H:%M'),
+                *[CYCLE_60[i] for i in pillars]
+            ))
+        else:
+            pillars = get_pillars_by_ordinal(date2ordinal(value), 0)
+            lines.append('{0}  {1}年 {2}月 {3}日'.format(
+                value.isoformat(), *[CYCLE_60[i] for i in pillars[:3]]
+            ))
+        # 分批輸出，結果再多也不會全部留在內存中
+        if len(lines) >= 1024:
+            sys.stdout.write('\n'.join(lines) + '\n')
+            lines = []
+    if lines:
+        sys.stdout.write('\n'.join(lines) + '\n')
+
+
+ICS_PRODID = '-//zhcal//Chinese Calendar Toolkit//ZH'
+
+
+def get_lunar_str(ordinal):
+    '''返回農曆月日字符串，如「閏四月初一」
+
+    @param int ordinal
+    @return str
+    '''
+    result = LUNAR_MONTHS[DAY_INDEX['lunar_month'][ordinal]] + '月' + \
+        get_lunar_date_str(DAY_INDEX['lunar_date'][ordinal])
+    if DAY_INDEX['is_leap_month'][ordinal]:
+        result = '閏' + result
+    return result
+
+
+def iter_ics_events(start, end, lunar_days=True, solar_terms=True,
+                    festivals=True):
+    '''按日期順序逐個生成 [start, end] 內的全天事件，內存佔用與範圍無關
+
+    UID 只由日期和事件內容決定，重複導出時保持不變
+
+    @param datetime.date start
+    @param datetime.date end
+    @param bool lunar_days 每日的農曆日期
+    @param bool solar_terms 二十四節氣
+    @param bool festivals FESTIVALS 與 SOLAR_FESTIVALS
+    @return generator<dict { uid, date, summary, category }>
+    '''
+    begin = max(date2ordinal(start), 0)
+    end = min(date2ordinal(end), DAY_COUNT - 1)
+    terms = SOLAR_TERM_TABLE['ordinal']
+    festival_ordinals, festival_kinds, festival_indexes = \
+        get_festival_columns()
+    term = bisect_left(terms, begin)
+    festival = bisect_left(festival_ordinals, begin)
+    for ordinal in range(begin, end + 1):
+        date = ordinal2date(ordinal)
+        stamp = date.strftime('%Y%m%d')
+        if lunar_days:
+            yield {
+                'uid': '{0}-lunar@zhcal'.format(stamp),
+                'date': date,
+                'summary': get_lunar_str(ordinal),
+                'category': 'LUNAR'
+            }
+        while term < len(terms) and terms[term] == ordinal:
+            if solar_terms:
+                yield {
+                    'uid': '{0}-term-{1}@zhcal'.format(stamp, term % 24),
+                    'date': date,
+                    'summary': SOLAR_TERMS[term % 24],
+                    'category': 'SOLAR_TERM'
+                }
+            term += 1
+        while (festival < len(festival_ordinals)
+               and festival_ordinals[festival] == ordinal):
+            if festivals:
+                kind = festival_kinds[festival]
+                name = [FESTIVALS, SOLAR_FESTIVALS][kind][
+                    festival_indexes[festival]
+                ]['name']
+                yield {
+                    'uid': '{0}-festival-{1:08x}@zhcal'.format(
+                        stamp, zlib.crc32(name.encode('utf-8'))
+                    ),
+                    'date': date,
+                    'summary': name,
+                    'category': 'FESTIVAL'
+                }
+            festival += 1
+
+
+def ics_escape(text):
+    '''轉義 iCalendar TEXT 值
+
+    @param str text
+    @return str
+    '''
+    return (text.replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\n', '\\n'))
+
+
+def ics_fold(line):
+    '''按 RFC 5545 將內容行折疊為不超過 75 字節的行，並加上 CRLF
+
+    @param str line
+    @return str
+    '''
+    result = ''
+    size = 0
+    for char in line:
+        length = len(char.encode('utf-8'))
+        if size + length > 75:
+            result += '\r\n '
+            size = 1
+        result += char
+        size += length
+    return result + '\r\n'
+
+
+def iter_ics_lines(start, end, dtstamp=None, **kwargs):
+    '''逐行生成 [start, end] 的 iCalendar 文本（每行以 CRLF 結尾）
+
+    @param datetime.date start
+    @param datetime.date end
+    @param datetime.datetime dtstamp 默認為當前時間
+    @param kwargs 見 iter_ics_events
+    @return generator<str>
+    '''
+    if dtstamp is None:
+        dtstamp = datetime.datetime.now(datetime.timezone.utc)
+    stamp = dtstamp.astimezone(datetime.timezone.utc).strftime(
+        '%Y%m%dT%H%M%SZ'
+    )
+    for line in ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:' + ICS_PRODID,
+                 'CALSCALE:GREGORIAN', 'X-WR-CALNAME:' + ics_escape('農曆')]:
+        yield ics_fold(line)
+    one_day = datetime.timedelta(1)
+    for event in iter_ics_events(start, end, **kwargs):
+        for line in [
+            'BEGIN:VEVENT',
+            'UID:' + event['uid'],
+            'DTSTAMP:' + stamp,
+            'DTSTART;VALUE=DATE:' + event['date'].strftime('%Y%m%d'),
+            'DTEND;VALUE=DATE:' + (event['date'] + one_day).strftime('%Y%m%d'),
+            'SUMMARY:' + ics_escape(event['summary']),
+            'CATEGORIES:' + event['category'],
+            'TRANSP:TRANSPARENT',
+            'END:VEVENT'
+        ]:
+            yield ics_fold(line)
+    yield ics_fold('END:VCALENDAR')
+
+
+def parse_date_arg(text, is_end=False):
+    '''解析命令行中的年份 (YYYY) 或日期 (YYYY-MM-DD)
+
+    @param str text
+    @param bool is_end 只有年份時取年末而非年初
+    @return datetime.date
+    '''
+    if len(text) == 4 and text.isdigit():
+        if is_end:
+            return datetime.date(int(text), 12, 31)
+        return datetime.date(int(text), 1, 1)
+    return datetime.date.fromisoformat(text)
+
+
+def print_ics(args):
+    start = parse_date_arg(args.start)
+    end = parse_date_arg(args.end or args.start, True)
+    check_year_range(start.year)
+    check_year_range(end.year)
+    lines = iter_ics_lines(start, end, lunar_days=not args.no_lunar,
+                           solar_terms=not args.no_terms,
+                           festivals=not args.no_festivals)
+    if args.output:
+        with open(args.output, 'wb') as output:
+            for line in lines:
+                output.write(line.encode('utf-8'))
+        return
+    output = sys.stdout.buffer
+    try:
+        for line in lines:
+            output.write(line.encode('utf-8'))
+        output.flush()
+    except BrokenPipeError:
+        # 下游（如 head）提前關閉了管道：按 Python 文檔的做法把 stdout
+        # 指向 devnull，避免退出時再次 flush 出錯
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
+
+
+# (列名, array 類型碼)；類型碼 's' 為 UTF-8 字符串列
+EXPORT_COLUMNS = [
+    ('ordinal', 'H'),
+    ('lunar_year', 'H'),
+    ('lunar_month', 'B'),
+    ('lunar_date', 'B'),
+    ('is_leap_month', 'B'),
+    ('zodiac', 'B'),
+    ('year_pillar', 'B'),
+    ('month_pillar', 'B'),
+    ('day_pillar', 'B')
+] + [('hour_pillar_{0}'.format(i), 'B') for i in range(0, 12)] + [
+    ('solar_term', 'b'),
+    ('festivals', 's')
+]
+EXPORT_MAGIC = b'ZHCALEXP'
+EXPORT_VERSION = 1
+# magic, version, rows, columns
+EXPORT_HEADER = struct.Struct('<8sIII')
+# name, typecode, size
+EXPORT_COLUMN = struct.Struct('<32sc3xQ')
+
+
+def export_year_columns(year):
+    '''生成一年逐日的導出數據
+
+    @param int year in range(1901, 2050)
+    @return dict { EXPORT_COLUMNS } 數字列為 array，festivals 為 list<str>
+    '''
+    check_year_range(year)
+    begin = date2ordinal(datetime.date(year, 1, 1))
+    end = date2ordinal(datetime.date(year + 1, 1, 1))
+    result = {}
+    result['ordinal'] = array('H', range(begin, end))
+    for name, source in [('lunar_year', DAY_INDEX['lunar_year']),
+                         ('lunar_month', DAY_INDEX['lunar_month']),
+                         ('lunar_date', DAY_INDEX['lunar_date']),
+                         ('is_leap_month', DAY_INDEX['is_leap_month']),
+                         ('year_pillar', PILLAR_INDEX['year']),
+                         ('month_pillar', PILLAR_INDEX['month']),
+                         ('day_pillar', PILLAR_INDEX['day'])]:
+        result[name] = array(dict(EXPORT_COLUMNS)[name], source[begin:end])
+    result['zodiac'] = array('B', [
+        get_year_cycle_index_approx(lunar_year) % 12
+        for lunar_year in result['lunar_year']
+    ])
+    for i in range(0, 12):
+        result['hour_pillar_{0}'.format(i)] = array('B', [
+            (day % 5 * 12 + i) % 60 for day in result['day_pillar']
+        ])
+
+    result['solar_term'] = array('b', [-1]) * (end - begin)
+    for i in range(0, 24):
+        ordinal = SOLAR_TERM_TABLE['ordinal'][(year-1901)*24 + i]
+        result['solar_term'][ordinal - begin] = i
+    festivals = [[] for _ in range(begin, end)]
+    for festival in festivals_between(datetime.date(year, 1, 1),
+                                      datetime.date(year, 12, 31)):
+        festivals[date2ordinal(festival['date']) - begin].append(
+            festival['name']
+        )
+    result['festivals'] = ['|'.join(names) for names in festivals]
+    return result
+
+
+def encode_export_column(typecode, values):
+    '''將一列編碼為字節串；字符串列為 (rows + 1) 個 uint32 偏移量加 UTF-8 數據
+
+    @param str typecode
+    @param array or list<str> values
+    @return bytes
+    '''
+    if typecode != 's':
+        return values.tobytes()
+    blob = bytearray()
+    offsets = array('I', [0])
+    for value in values:
+        blob += value.encode('utf-8')
+        offsets.append(len(blob))
+    return offsets.tobytes() + bytes(blob)
+
+
+def export_shard(task):
+    '''將一年的數據寫入分片文件（可在工作進程中執行）
+
+    @param tuple(int year, str path, str output_format) task
+    @return tuple(int year, str path, int rows, list<int> column_sizes)
+    '''
+    year, path, output_format = task
+    columns = export_year_columns(year)
+    rows = len(columns['ordinal'])
+    sizes = []
+    if output_format == 'csv':
+        import csv
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            for i in range(0, rows):
+                row = [columns[name][i] for name, _ in EXPORT_COLUMNS]
+                row[0] = ordinal2date(row[0]).isoformat()
+                if row[-2] < 0:
+                    row[-2] = ''
+                writer.writerow(row)
+    else:
+        with open(path, 'wb') as f:
+            for name, typecode in EXPORT_COLUMNS:
+                data = encode_export_column(typecode, columns[name])
+                f.write(data)
+                sizes.append(len(data))
+    return year, path, rows, sizes
+
+
+def merge_export_shards(shards, output, output_format):
+    '''按年份順序合併分片
+
+    @param list<tuple> shards export_shard 的返回值，按年份排列
+    @param file output 二進制模式
+    @param str output_format
+    '''
+    import shutil
+    if output_format == 'csv':
+        header = ['date'] + [name for name, _ in EXPORT_COLUMNS[1:]]
+        output.write((','.join(header) + '\n').encode('utf-8'))
+        for _, path, _, _ in shards:
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, output)
+        return
+
+    rows = sum(shard[2] for shard in shards)
+    output.write(EXPORT_HEADER.pack(EXPORT_MAGIC, EXPORT_VERSION, rows,
+                                    len(EXPORT_COLUMNS)))
+    files = [open(path, 'rb') for _, path, _, _ in shards]
+    try:
+        for i, (name, typecode) in enumerate(EXPORT_COLUMNS):
+            if typecode == 's':
+                # 各分片的偏移量從 0 開始，合併時需要平移
+                offsets = array('I', [0])
+                blobs = []
+                for shard, f in zip(shards, files):
+                    data = f.read(shard[3][i])
+                    count = (shard[2] + 1) * 4
+                    part = array('I', data[:count])
+                    base = offsets[-1]
+                    offsets.extend(base + offset for offset in part[1:])
+                    blobs.append(data[count:])
+                data = offsets.tobytes() + b''.join(blobs)
+                output.write(EXPORT_COLUMN.pack(name.encode('ascii'),
+                                                b's', len(data)))
+                output.write(data)
+                continue
+            size = sum(shard[3][i] for shard in shards)
+            output.write(EXPORT_COLUMN.pack(name.encode('ascii'),
+                                            typecode.encode('ascii'), size))
+            for shard, f in zip(shards, files):
+                output.write(f.read(shard[3][i]))
+    finally:
+        for f in files:
+            f.close()
+
+
+def export_dataset(output, output_format='csv', start=1901, end=2049,
+                   workers=1, progress=None):
+    '''導出 [start, end] 年逐日的農曆、生肖、四柱、節氣及節日數據
+
+    按年份分片，由 workers 個進程並行生成，再按順序合併寫入 output
+
+    @param file output 二進制模式
+    @param str output_format 'csv' or 'binary'
+    @param int start
+    @param int end
+    @param int workers
+    @param callable progress progress(done, total)，每完成一個分片調用一次
+    @return int 行數
+    '''
+    import shutil
+    import tempfile
+    check_year_range(start)
+    check_year_range(end)
+    directory = tempfile.mkdtemp(prefix='zhcal-export-')
+    try:
+        tasks = [
+            (year, os.path.join(directory, '{0}.part'.format(year)),
+             output_format)
+            for year in range(start, end + 1)
+        ]
+        shards = []
+        if workers <= 1:
+            for task in tasks:
+                shards.append(export_shard(task))
+                if progress:
+                    progress(len(shards), len(tasks))
+        else:
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+            with ProcessPoolExecutor(workers) as executor:
+                futures = [executor.submit(export_shard, task)
+                           for task in tasks]
+                for future in as_completed(futures):
+                    shards.append(future.result())
+                    if progress:
+                        progress(len(shards), len(tasks))
+            shards.sort()
+        merge_export_shards(shards, output, output_format)
+        return sum(shard[2] for shard in shards)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def load_export(path):
+    '''讀取二進制導出文件
+
+    @param str path
+    @return dict { column name: array or list<str> }
+    '''
+    result = {}
+    with open(path, 'rb') as f:
+        magic, version, rows, count = EXPORT_HEADER.unpack(
+            f.read(EXPORT_HEADER.size)
+        )
+        if magic != EXPORT_MAGIC or version != EXPORT_VERSION:
+            raise ValueError('Not a zhcal export file')
+        for _ in range(0, count):
+            name, typecode, size = EXPORT_COLUMN.unpack(
+                f.read(EXPORT_COLUMN.size)
+            )
+            name = name.rstrip(b'\0').decode('ascii')
+            typecode = typecode.decode('ascii')
+            data = f.read(size)
+            if typecode == 's':
+                offsets = array('I', data[:(rows + 1) * 4])
+                blob = data[(rows + 1) * 4:]
+                result[name] = [
+                    blob[offsets[i]:offsets[i+1]].decode('utf-8')
+                    for i in range(0, rows)
+                ]
+            else:
+                result[name] = array(typecode, data)
+    return result
+
+
+def print_export(args):
+    interactive = sys.stderr.isatty()
+
+    def progress(done, total):
+        # 輸出被重定向時只報告完成
+        if interactive:
+            print('\rexport: {0}/{1} years'.format(done, total), end='',
+                  file=sys.stderr, flush=True)
+        if done == total:
+            if interactive:
+                print(file=sys.stderr)
+            else:
+                print('export: {0} years'.format(total), file=sys.stderr)
+
+    if args.output:
+        output = open(args.output, 'wb')
+    else:
+        output = sys.stdout.buffer
+    try:
+        export_dataset(output, args.format, args.start, args.end,
+                       args.workers, None if args.quiet else progress)
+    finally:
+        if args.output:
+            output.close()
+        else:
+            output.flush()
+
+
+# 請求延遲直方圖的桶上限（秒）
+SERVE_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                 0.05, 0.1, 0.25, 0.5, 1.0]
+# 請求體大小上限（字節）
+SERVE_MAX_BODY = 16 * 1024 * 1024
+# keep-alive 連接的空閒超時（秒）
+SERVE_KEEP_ALIVE = 15
+SERVE_STATUS = {
+    200: 'OK',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    431: 'Request Header Fields Too Large',
+    500: 'Internal Server Error'
+}
+
+
+class HTTPError(Exception):
+    '''以指定的狀態碼結束請求處理
+
+    @param int status SERVE_STATUS 中的狀態碼
+    '''
+
+    def __init__(self, status):
+        super(HTTPError, self).__init__(status)
+        self.status = status
+
+
+class ServeMetrics(object):
+    '''按路徑統計請求數和延遲直方圖'''
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.requests = {}
+        self.histograms = {}
+
+    def observe(self, path, status, seconds):
+        '''記錄一次請求
+
+        @param str path
+        @param int status
+        @param float seconds
+        '''
+        key = (path, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        histogram = self.histograms.get(path)
+        if histogram is None:
+            histogram = self.histograms[path] = {
+                # 最後一格記錄超出最大桶上限的請求
+                'buckets': [0] * (len(SERVE_BUCKETS) + 1),
+                'sum': 0.0
+            }
+        histogram['buckets'][bisect_left(SERVE_BUCKETS, seconds)] += 1
+        histogram['sum'] += seconds
+
+    def render(self):
+        '''以 Prometheus 文本格式輸出
+
+        @return str
+        '''
+        lines = [
+            '# TYPE zhcal_uptime_seconds gauge',
+            'zhcal_uptime_seconds {0:.3f}'.format(
+                time.time() - self.start_time
+            ),
+            '# TYPE zhcal_requests_total counter'
+        ]
+        for (path, status), count in sorted(self.requests.items()):
+            lines.append('zhcal_requests_total{{path="{0}",status="{1}"}} {2}'
+                         .format(path, status, count))
+        lines.append('# TYPE zhcal_request_duration_seconds histogram')
+        for path, histogram in sorted(self.histograms.items()):
+            total = 0
+            for bound, count in zip(SERVE_BUCKETS + ['+Inf'],
+                                    histogram['buckets']):
+                total += count
+                lines.append('zhcal_request_duration_seconds_bucket'
+                             '{{path="{0}",le="{1}"}} {2}'
+                             .format(path, bound, total))
+            lines.append('zhcal_request_duration_seconds_sum{{path="{0}"}} '
+                         '{1:.6f}'.format(path, histogram['sum']))
+            lines.append('zhcal_request_duration_seconds_count{{path="{0}"}} '
+                         '{1}'.format(path, total))
+        lines.append('# TYPE zhcal_cache_hits_total counter')
+        lines.append('# TYPE zhcal_cache_misses_total counter')
+        for name, cache in sorted(CACHES.items()):
+            info = cache.info()
+            lines.append('zhcal_cache_hits_total{{cache="{0}"}} {1}'
+                         .format(name, info['hits']))
+            lines.append('zhcal_cache_misses_total{{cache="{0}"}} {1}'
+                         .format(name, info['misses']))
+        return '\n'.join(lines) + '\n'
+
+
+def get_query_arg(query, name, convert=str, default=None):
+    '''讀取查詢參數
+
+    @param dict query parse_qs 的結果
+    @param str name
+    @param callable convert
+    @param object default 為 None 時參數必須提供
+    @return object
+    '''
+    if name not in query:
+        if default is None:
+            raise ValueError('Missing parameter: ' + name)
+        return default
+    return convert(query[name][-1])
+
+
+def parse_bool(text):
+    return text.lower() in ['1', 'true', 'yes']
+
+
+def serve_gregorian_to_zh(query):
+    date = datetime.date.fromisoformat(get_query_arg(query, 'date'))
+    result = gregorian_to_zh(date)
+    result['lunar_year'] = DAY_INDEX['lunar_year'][date2ordinal(date)]
+    return result, date.year
+
+
+def serve_zh_to_gregorian(query):
+    year = get_query_arg(query, 'year', int)
+    date = zh_to_gregorian(year, get_query_arg(query, 'month', int),
+                           get_query_arg(query, 'day', int),
+                           get_query_arg(query, 'leap', parse_bool, False))
+    return {'date': date}, date.year
+
+
+def serve_pillars(query):
+    date_time = datetime.datetime.fromisoformat(
+        get_query_arg(query, 'datetime')
+    )
+    if date_time.tzinfo is not None:
+        date_time = date_time.astimezone(tz)
+    ordinal = date2ordinal(date_time.date())
+    pillars = get_pillars_by_ordinal(ordinal, date_time.hour)
+    return {
+        'pillars': [CYCLE_60[i] for i in pillars],
+        'indices': pillars,
+        'zodiac': ZODIAC[get_year_cycle_index_approx(
+            DAY_INDEX['lunar_year'][ordinal]
+        ) % 12]
+    }, date_time.year
+
+
+def serve_festivals(query):
+    if 'year' in query:
+        year = get_query_arg(query, 'year', int)
+        check_year_range(year)
+        start = datetime.date(year, 1, 1)
+        end = datetime.date(year, 12, 31)
+    else:
+        start = datetime.date.fromisoformat(get_query_arg(query, 'start'))
+        end = datetime.date.fromisoformat(get_query_arg(query, 'end'))
+        check_year_range(start.year)
+        check_year_range(end.year)
+    return {'festivals': festivals_between(start, end)}, end.year
+
+
+def serve_month_grid(query):
+    year = get_query_arg(query, 'year', int)
+    grid = month_grid(year, get_query_arg(query, 'month', int),
+                      get_query_arg(query, 'first_weekday', int, 0))
+    return {
+        'weeks': [[cell and dict(cell) for cell in week] for week in grid]
+    }, year
+
+
+def serve_batch(body):
+    '''批量轉換，請求體為 JSON 數組或 { "dates": [...] }
+
+    @param bytes body
+    @return dict { results, errors }
+    '''
+    import json
+    items = json.loads(body.decode('utf-8'))
+    if isinstance(items, dict):
+        items = items.get('dates')
+    if not isinstance(items, list):
+        raise ValueError('Expected a list of dates')
+    results = []
+    errors = []
+    for i, item in enumerate(items):
+        try:
+            results.append(convert_record(str(item)))
+        except (ValueError, NotImplementedError) as e:
+            results.append(None)
+            errors.append({'index': i, 'error': str(e)})
+    return {'results': results, 'errors': errors}
+
+
+# path: 處理函數，返回 (結果, 結果所屬的格里曆年)
+SERVE_ROUTES = {
+    '/gregorian_to_zh': serve_gregorian_to_zh,
+    '/zh_to_gregorian': serve_zh_to_gregorian,
+    '/pillars': serve_pillars,
+    '/festivals': serve_festivals,
+    '/month_grid': serve_month_grid
+}
+
+
+def json_default(value):
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def handle_request(method, target, headers, body, metrics):
+    '''處理一個 HTTP 請求
+
+    @param str method
+    @param str target
+    @param dict headers 小寫鍵名
+    @param bytes body
+    @param ServeMetrics metrics
+    @return tuple(int status, dict headers, bytes body)
+    '''
+    import json
+    from urllib.parse import parse_qs, urlsplit
+    url = urlsplit(target)
+    path = url.path
+    result_headers = {'Content-Type': 'application/json; charset=utf-8'}
+    year = None
+    try:
+        if path == '/metrics':
+            if method != 'GET':
+                raise HTTPError(405)
+            result_headers = {'Content-Type': 'text/plain; version=0.0.4'}
+            return 200, result_headers, metrics.render().encode('utf-8')
+        if path == '/batch':
+            if method != 'POST':
+                raise HTTPError(405)
+            result = serve_batch(body)
+        elif path in SERVE_ROUTES:
+            if method not in ['GET', 'HEAD']:
+                raise HTTPError(405)
+            result, year = SERVE_ROUTES[path](parse_qs(url.query))
+        else:
+            raise HTTPError(404)
+        status = 200
+    except HTTPError as e:
+        status = e.status
+        result = {'error': SERVE_STATUS[status]}
+    except (ValueError, TypeError, NotImplementedError) as e:
+        status = 400
+        result = {'error': str(e) or e.__class__.__name__}
+    payload = json.dumps(result, ensure_ascii=False,
+                         default=json_default).encode('utf-8')
+    if status == 200 and year is not None:
+        # 結果只由參數和數據表決定；往年的結果永不改變
+        etag = '"{0:08x}"'.format(zlib.crc32(payload))
+        result_headers['ETag'] = etag
+        if year < datetime.datetime.now(tz).year:
+            result_headers['Cache-Control'] = \
+                'public, max-age=31536000, immutable'
+        else:
+            result_headers['Cache-Control'] = 'public, max-age=86400'
+        if etag in headers.get('if-none-match', ''):
+            return 304, result_headers, b''
+    return status, result_headers, payload
+
+
+async def read_request_head(reader, request_line):
+    '''解析請求行並讀取其後的請求頭
+
+    @param asyncio.StreamReader reader
+    @param bytes request_line
+    @return tuple(str method, str target, str version, dict headers)
+        headers 為小寫鍵名
+    '''
+    import asyncio
+    try:
+        method, target, version = request_line.decode('latin-1').split()
+    except ValueError:
+        raise HTTPError(400)
+    headers = {}
+    while True:
+        try:
+            line = await reader.readline()
+        except (asyncio.LimitOverrunError, ValueError):
+            # 單行超出 StreamReader 的長度限制
+            raise HTTPError(431)
+        if not line.strip():
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return method, target, version, headers
+
+
+def get_content_length(headers):
+    '''返回請求體長度
+
+    @param dict headers
+    @return int in range(0, SERVE_MAX_BODY + 1)
+    '''
+    length = headers.get('content-length', '').strip() or '0'
+    if not (length.isascii() and length.isdigit()):
+        raise HTTPError(400)
+    if int(length) > SERVE_MAX_BODY:
+        raise HTTPError(413)
+    return int(length)
+
+
+async def serve_connection(reader, writer, metrics):
+    '''處理一個連接上的請求，支持 HTTP/1.1 keep-alive
+
+    @param asyncio.StreamReader reader
+    @param asyncio.StreamWriter writer
+    @param ServeMetrics metrics
+    '''
+    import asyncio
+    try:
+        while True:
+            try:
+                request_line = await asyncio.wait_for(reader.readline(),
+                                                      SERVE_KEEP_ALIVE)
+            except asyncio.TimeoutError:
+                break
+            except (asyncio.LimitOverrunError, ValueError):
+                # 請求行超出 StreamReader 的長度限制
+                request_line = None
+            if request_line is not None and not request_line.strip():
+                break
+            start = time.perf_counter()
+            method = None
+            target = ''
+            try:
+                if request_line is None:
+                    raise HTTPError(400)
+                method, target, version, headers = \
+                    await read_request_head(reader, request_line)
+                connection = headers.get('connection', '').lower()
+                if version == 'HTTP/1.0':
+                    keep_alive = connection == 'keep-alive'
+                else:
+                    keep_alive = connection != 'close'
+                length = get_content_length(headers)
+                body = await reader.readexactly(length) if length else b''
+            except HTTPError as e:
+                # 請求無法完整讀取，回應後關閉連接
+                status = e.status
+                response_headers = {}
+                payload = b''
+                keep_alive = False
+            else:
+                try:
+                    status, response_headers, payload = handle_request(
+                        method, target, headers, body, metrics
+                    )
+                except Exception:
+                    status = 500
+                    response_headers = {}
+                    payload = b''
+
+            response_headers['Content-Length'] = str(len(payload))
+            response_headers['Connection'] = \
+                'keep-alive' if keep_alive else 'close'
+            head = ['HTTP/1.1 {0} {1}'.format(status, SERVE_STATUS[status])]
+            for name, value in response_headers.items():
+                head.append('{0}: {1}'.format(name, value))
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+            if method != 'HEAD':
+                writer.write(payload)
+            await writer.drain()
+            path = target.split('?', 1)[0]
+            metrics.observe(path if path in SERVE_ROUTES
+                            or path in ['/batch', '/metrics'] else 'other',
+                            status, time.perf_counter() - start)
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+def serve(host='127.0.0.1', port=8080):
+    '''啟動 HTTP/JSON 轉換服務，直至被中斷
+
+    GET  /gregorian_to_zh?date=2015-10-05
+    GET  /zh_to_gregorian?year=2015&month=8&day=23&leap=0
+    GET  /pillars?datetime=2015-10-05T20:46
+    GET  /festivals?year=2015 或 ?start=2015-01-01&end=2015-03-31
+    GET  /month_grid?year=2015&month=10&first_weekday=0
+    POST /batch  ["2015-01-01", "2015-01-01 23:10", ...]
+    GET  /metrics
+
+    @param str host
+    @param int port
+    '''
+    import asyncio
+    # 啟動前載入全部查詢表，使首個請求不必等待
+    for table in LAZY_TABLES:
+        table.load()
+    metrics = ServeMetrics()
+
+    async def run():
+        server = await asyncio.start_server(
+            lambda reader, writer: serve_connection(reader, writer, metrics),
+            host, port
+        )
+        address = server.sockets[0].getsockname()
+        print('Serving on http://{0}:{1}'.format(address[0], address[1]),
+              file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+# 以下 reference_* 為查詢表和快速路徑引入之前的原始算法的凍結副本，
+# 僅按 user-001 修正了閏月大小的判定。verify 以它們為準核對優化後的
+# 實現，因此不要為了提速修改這部分代碼
+
+
+def reference_get_cycle_60(cycle_10, cycle_12):
+    '''將一對天干索引和地支索引轉換為六十甲子索引（參照實現）
+
+    @param int cycle_10 in range(0, 10)
+    @param int cycle_12 in range(0, 12)
+    @return int in range(0, 60)
+    '''
+    result = 0
+    i = 0
+    j = 0
+    for k in range(0, 60):
+        if i == cycle_10 and j == cycle_12:
+            result = k
+            break
+        i = (i + 1) % 10
+        j = (j + 1) % 12
+    return result
 
-def print_info(args):
-    print_datetime(datetime.datetime(args.year, args.month, args.day,
-                                     args.hour, args.m, 0, tzinfo=tz))
 
+def reference_get_solar_term_date(index, year):
+    '''計算節氣日期（參照實現）
 
-def print_now(args):
-    print_datetime(datetime.datetime.now(tz))
+    Algorithm from Sean Lin (sean.o4u.com)
 
+    @param int index in range(0, 24)
+    @param int year in range(1901, 2050)
+    @return datetime.date
+    '''
+    return datetime.date(year, index//2 + 1, SOLAR_TERM_BASE[index] + int(
+       SOLAR_TERM_OFFSET[(ord(SOLAR_TERM_INDEX[year-1900]) - 48) * 24 + index]
+    ))
 
-def print_festivals(year):
-    check_year_range(year)
-    festivals = get_festivals_date(year)
-    for festival in festivals:
-        print('{0} {1}月{2}  {3} 月 {4} 日  週{5}'.format(
-            festival['name'],
-            LUNAR_MONTHS[festival['lunar_date'][0]],
-            get_lunar_date_str(festival['lunar_date'][1]),
-            num_prepend_blank(festival['date'].month),
-            num_prepend_blank(festival['date'].day),
-            WEEKDAYS[festival['date'].weekday()]
-        ))
-    print('')
+
+def reference_get_leap_month(year):
+    '''返回當年閏月，0 代表沒有閏月（參照實現）
+
+    @param int year in range(1901, 2050)
+    @return int in range(0, 13)
+    '''
+    month = LUNAR_MONTH_LENGTH[year-1900] & 0xf
+    if month == 0xf:
+        return 0
+    else:
+        return month
+
+
+def reference_get_month_day_count(month, year):
+    '''返回當年當月的天數（參照實現）
+
+    @param int month in range(0, 13) 0 表示閏月
+    @param int year in range(1901, 2050)
+    @return int in range(29, 31)
+    '''
+    if month:
+        if LUNAR_MONTH_LENGTH[year-1900] & (0x10000 >> month):
+            return 30
+        else:
+            return 29
+    else:
+        if LUNAR_MONTH_LENGTH[year+1-1900] & 0xf == 0xf:
+            return 30
+        else:
+            return 29
+
+
+def reference_build_calendar(year):
+    '''生成農曆年曆數據（參照實現）
+
+    @param int year in range(1901, 2050)
+    @return list<
+        dict { lunar_month, lunar_date, is_leap_month, timestamp }
+    >
+    '''
+    initial_month = (
+        LUNAR_DATE_OF_INITIAL_DAYS[year-1900] & (0x3 << 6)
+    ) >> 6
+    initial_date = LUNAR_DATE_OF_INITIAL_DAYS[year-1900] & 0x3f
+    leap = reference_get_leap_month(year)
+    year_day_count = 365 + is_leap_year(year)
+
+    data = []
+    result = []
+
+    if initial_month == 0:
+        # 冬月
+        data.append({
+            'index': 11,
+            'day_count': reference_get_month_day_count(11, year-1),
+            'is_leap': False
+        })
+    elif initial_month == 2:
+        # 閏冬月
+        data.append({
+            'index': 11,
+            'day_count': reference_get_month_day_count(0, year-1),
+            'is_leap': True
+        })
+    data.append({
+        'index': 12,
+        'day_count': reference_get_month_day_count(12, year-1),
+        'is_leap': False
+    })
+
+    for i in range(1, 13):
+        data.append({
+            'index': i,
+            'day_count': reference_get_month_day_count(i, year),
+            'is_leap': False
+        })
+        if leap == i:
+            data.append({
+                'index': i,
+                'day_count': reference_get_month_day_count(0, year),
+                'is_leap': True
+            })
+
+    ts = date2ts(datetime.date(year, 1, 1))
+    lunar_date = initial_date
+    j = 0
+    for i in range(0, year_day_count):
+        if lunar_date > data[j]['day_count']:
+            lunar_date = 1
+            j += 1
+        result.append({
+            'timestamp': ts,
+            'lunar_date': lunar_date,
+            'lunar_month': data[j]['index'],
+            'is_leap_month': data[j]['is_leap']
+        })
+        lunar_date += 1
+        ts += DAY_SEC
+
+    return result
+
+
+def reference_get_festivals_date(days):
+    '''返回當年農曆節日的格里曆日期（參照實現）
+
+    @param list days reference_build_calendar 的結果
+    @return list<
+        dict { date, lunar_date, name }
+    >
+    '''
+    result = []
+    prev_day_lunar_date = -1
+    for day in days:
+        for festival in FESTIVALS:
+            if festival['date'][0] == day['lunar_month']:
+                if festival['date'][1] == day['lunar_date']:
+                    result.append({
+                        'date': TS_ZERO + datetime.timedelta(
+                            seconds=day['timestamp']
+                        ),
+                        'lunar_date': festival['date'],
+                        'name': festival['name']
+                    })
+                elif (festival['date'][1] == 0 and day['lunar_date'] == 1
+                      and prev_day_lunar_date != -1):
+                    result.append({
+                        'date': TS_ZERO + datetime.timedelta(
+                            seconds=day['timestamp'] - DAY_SEC
+                        ),
+                        'lunar_date': (
+                            (festival['date'][0] - 1 - 1) % 12 + 1,
+                            prev_day_lunar_date
+                        ),
+                        'name': festival['name']
+                    })
+        prev_day_lunar_date = day['lunar_date']
+    return result
+
+
+def reference_get_hour_cycle_index(day_cycle_index, hour):
+    '''干支紀時（參照實現，日柱已知）
+
+    @param int day_cycle_index in range(0, 60)
+    @param int hour in range(0, 24)
+    @return int in range(0, 60)
+    '''
+    cycle_12 = (hour + 1) // 2 % 12
+    cycle_10 = (cycle_12 + (day_cycle_index % 10 % 5) * 2) % 10
+    return reference_get_cycle_60(cycle_10, cycle_12)
+
+
+def reference_year(year):
+    '''按參照算法一次性生成一年逐日的預期結果
+
+    年曆、節氣和節日每年只計算一次，逐日的年柱、月柱和生肖按原算法的
+    比較規則在其上求出
+
+    @param int year in range(1901, 2050)
+    @return dict {
+        days: list<dict {
+            date, lunar_year, lunar_month, lunar_date, is_leap_month,
+            year_pillar, month_pillar, day_pillar, zodiac
+        }>,
+        solar_terms: list<datetime.date> 24 個節氣,
+        festivals: list<tuple(date, name)> 按日期排列，含節氣節日
+    }
+    '''
+    calendar = reference_build_calendar(year)
+    solar_terms = [reference_get_solar_term_date(i, year)
+                   for i in range(0, 24)]
+    year_index = (TS_ZERO_YEAR_CYCLE_INDEX + (year - 1970)) % 60
+    month_index = (TS_ZERO_MONTH_CYCLE_INDEX + (year - 1970) * 12) % 60
+    zodiac = year_index % 12
+    days = []
+    # 正月初一以前屬於上一農曆年
+    lunar_year = year - 1
+    for day in calendar:
+        date = TS_ZERO + datetime.timedelta(seconds=day['timestamp'])
+        if (day['lunar_month'] == 1 and day['lunar_date'] == 1
+                and not day['is_leap_month']):
+            lunar_year = year
+        add = 12
+        for i in range(0, 12):
+            if date < solar_terms[i*2]:
+                add = i
+                break
+        days.append({
+            'date': date,
+            'lunar_year': lunar_year,
+            'lunar_month': day['lunar_month'],
+            'lunar_date': day['lunar_date'],
+            'is_leap_month': day['is_leap_month'],
+            'year_pillar': (year_index - (date < solar_terms[2])) % 60,
+            'month_pillar': (month_index + add) % 60,
+            'day_pillar': (TS_ZERO_DAY_CYCLE_INDEX
+                           + day['timestamp'] // DAY_SEC) % 60,
+            'zodiac': (zodiac - (lunar_year < year)) % 12
+        })
+    festivals = [(festival['date'], festival['name'])
+                 for festival in reference_get_festivals_date(calendar)]
     for festival in SOLAR_FESTIVALS:
-        ts = date2ts(get_solar_term_date(festival['index'], year))
-        ts += festival['delta'] * 86400
-        date_time = datetime.datetime.utcfromtimestamp(ts)
-        print('{0} {1} 月 {2} 日  週{3}'.format(
-            festival['name'],
-            num_prepend_blank(date_time.month),
-            num_prepend_blank(date_time.day),
-            WEEKDAYS[date_time.weekday()]
+        festivals.append((
+            solar_terms[festival['index']]
+            + datetime.timedelta(festival['delta']),
+            festival['name']
         ))
+    festivals.sort()
+    return {
+        'days': days,
+        'solar_terms': solar_terms,
+        'festivals': festivals
+    }
 
 
-def print_calendar(year, month, first_weekday):
-    check_year_range(year)
-    # Print header
-    print('{:^63}'.format(MONTHS[month] + '月 ' + str(year)))
-    line = ''
-    print('')
-    for i in range(0, 7):
-        line += '   週{0}  '.format(WEEKDAYS[(i+first_weekday) % 7])
-    print(line)
+# verify 核對的字段
+VERIFY_FIELDS = ['lunar', 'zh_to_gregorian', 'year_pillar', 'month_pillar',
+                 'day_pillar', 'hour_pillar', 'zodiac', 'solar_term',
+                 'festival', 'timestamp', 'cycle_60']
 
-    # Initialize
-    first = True
-    days = build_calendar(year)
-    festivals = get_festivals_date(year)
-    st1 = get_solar_term_date((month - 1)*2, year)
-    st2 = get_solar_term_date((month - 1)*2 + 1, year)
-    now = datetime.datetime.now(tz)
-    today = now.date()
-    index = 0
-    line = ''
-    for date in Calendar(first_weekday).itermonthdates(year, month):
-        if date.month > month and date.year == year:
-            break
-        if date.weekday() == first_weekday:
-            print(line)
-            line = ''
-        if first and date.year == year:
-            ts = date2ts(date)
-            for i in range(0, len(days)):
-                if days[i]['timestamp'] == ts:
-                    index = i
-                    break
-            first = False
-        day = num_prepend_blank(date.day)
-        if date.month == month:
-            lunar_str = ''
-            lunar_date = days[index]['lunar_date']
-            for festival in festivals:
-                if date == festival['date']:
-                    lunar_str = festival['name']
-                    break
-            if lunar_str:
-                pass
-            elif date == st1:
-                lunar_str = SOLAR_TERMS[(month - 1)*2]
-            elif date == st2:
-                lunar_str = SOLAR_TERMS[(month - 1)*2 + 1]
-            elif lunar_date == 1:
-                month_str = LUNAR_MONTHS[days[index]['lunar_month']]
-                if days[index]['is_leap_month']:
-                    lunar_str = '閏' + month_str
-                else:
-                    lunar_str = month_str + '月'
-            else:
-                lunar_str = get_lunar_date_str(lunar_date)
-            if date == today:
-                line += inverse_color('{0} {1}'.format(day, lunar_str))
-                line += '  '
-            else:
-                line += '{0} {1}  '.format(day, lunar_str)
-        else:
-            line += '         '
-        index += 1
-    if line != '':
+# 每日核對的時刻：子時的兩段以及其餘各時辰的起點（小時）
+VERIFY_HOURS = [0] + list(range(1, 24, 2))
+
+
+def verify(start=1901, end=2049):
+    '''將各查詢表和快速路徑與凍結的參照算法逐日、逐時辰比較
+
+    @param int start 首年 in range(1901, 2050)
+    @param int end 末年（含）
+    @return dict { field: dict { checked, mismatches, first } }
+        first 為 None 或第一處不一致
+        dict { input, expected, actual }
+    '''
+    check_year_range(start)
+    check_year_range(end)
+    result = dict((field, {'checked': 0, 'mismatches': 0, 'first': None})
+                  for field in VERIFY_FIELDS)
+
+    def mismatch(field, key, expected, actual):
+        record = result[field]
+        record['mismatches'] += 1
+        if record['first'] is None:
+            record['first'] = {
+                'input': key,
+                'expected': expected,
+                'actual': actual
+            }
+
+    def check(field, key, expected, actual):
+        result[field]['checked'] += 1
+        if expected != actual:
+            mismatch(field, key, expected, actual)
+
+    for cycle_10 in range(0, 10):
+        for cycle_12 in range(cycle_10 % 2, 12, 2):
+            check('cycle_60', (cycle_10, cycle_12),
+                  reference_get_cycle_60(cycle_10, cycle_12),
+                  get_cycle_60(cycle_10, cycle_12))
+
+    hour_pillars = {}
+    for year in range(start, end + 1):
+        expected = reference_year(year)
+
+        for index in range(0, 24):
+            check('solar_term', (year, index), expected['solar_terms'][index],
+                  get_solar_term_date(index, year))
+
+        festivals = [(festival['date'], festival['name']) for festival in
+                     festivals_between(datetime.date(year, 1, 1),
+                                       datetime.date(year, 12, 31))]
+        festivals.sort()
+        check('festival', year, expected['festivals'], festivals)
+
+        timestamps = []
+        for day in expected['days']:
+            date = day['date']
+            lunar = (day['lunar_month'], day['lunar_date'],
+                     day['is_leap_month'])
+            zh = gregorian_to_zh(date)
+            check('lunar', date, lunar, (
+                zh['lunar_month'], zh['lunar_date'], zh['is_leap_month']
+            ))
+            if day['lunar_year'] in range(1901, 2050):
+                check('zh_to_gregorian', (day['lunar_year'],) + lunar, date,
+                      zh_to_gregorian(day['lunar_year'], *lunar))
+            check('year_pillar', date, day['year_pillar'],
+                  get_year_cycle_index(date))
+            check('month_pillar', date, day['month_pillar'],
+                  get_month_cycle_index(date))
+            check('day_pillar', date, day['day_pillar'],
+                  get_day_cycle_index(date))
+            check('zodiac', date, day['zodiac'], get_zodiac(date))
+            ts = date2ts(date) - 8 * 3600
+            for i in range(0, len(VERIFY_HOURS)):
+                # 分鐘按序輪換，使每個刻都被覆蓋
+                timestamps.append(ts + VERIFY_HOURS[i] * 3600
+                                  + (len(timestamps) % 4 * 15 + 7) * 60)
+
+        pillars = get_four_pillars_many(timestamps)
+        rows = ts_to_zh_many(timestamps)
+        if not isinstance(rows, list):
+            rows = rows.tolist()
+        result['hour_pillar']['checked'] += len(timestamps)
+        result['timestamp']['checked'] += len(timestamps)
+        for i in range(0, len(timestamps)):
+            day = expected['days'][i // len(VERIFY_HOURS)]
+            hour = VERIFY_HOURS[i % len(VERIFY_HOURS)]
+            minute = i % 4 * 15 + 7
+            key = (day['day_pillar'], hour)
+            hour_pillar = hour_pillars.get(key)
+            if hour_pillar is None:
+                hour_pillar = hour_pillars[key] = \
+                    reference_get_hour_cycle_index(*key)
+            row = (
+                day['lunar_year'], day['lunar_month'], day['lunar_date'],
+                day['is_leap_month'], (hour + 1) // 2 % 12,
+                4 * ((hour + 1) % 2) + minute // 15, day['year_pillar'],
+                day['month_pillar'], day['day_pillar'], hour_pillar
+            )
+            if pillars[i][3] == hour_pillar and rows[i][1:] == row:
+                continue
+            moment = datetime.datetime.combine(
+                day['date'], datetime.time(hour, minute)
+            )
+            if pillars[i][3] != hour_pillar:
+                mismatch('hour_pillar', moment, hour_pillar, pillars[i][3])
+            if rows[i][1:] != row:
+                mismatch('timestamp', moment, row, rows[i][1:])
+    return result
+
+
+def print_verify(args):
+    result = verify(args.start, args.end)
+    failed = False
+    for field in VERIFY_FIELDS:
+        record = result[field]
+        line = '{0:<16}{1:>10}{2:>8}'.format(field, record['checked'],
+                                             record['mismatches'])
+        if record['first'] is not None:
+            failed = True
+            line += '  first: {0!r} expected {1!r}, got {2!r}'.format(
+                record['first']['input'], record['first']['expected'],
+                record['first']['actual']
+            )
         print(line)
+    if failed:
+        sys.exit(1)
 
 
-def print_full_year(year, first_weekday):
-    check_year_range(year)
-    for i in range(1, 13):
-        print_calendar(year, i, first_weekday)
-        print('')
+# 單個函數最多保留的耗時樣本數，超出後按蓄水池抽樣替換
+STATS_SAMPLE_LIMIT = 10000
+# 不統計的函數
+STATS_EXCLUDE = ['main', 'enable_stats', 'disable_stats', 'reset_stats',
+                 'get_stats', 'print_stats', 'get_percentile',
+                 'rebind_stats_functions']
+# name: { calls, total, samples }
+STATS = {}
+# 被包裝前的原函數
+STATS_ORIGINALS = {}
+
+
+def get_percentile(samples, fraction):
+    '''@return float 已排序樣本的分位數'''
+    if not samples:
+        return 0.0
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+def rebind_stats_functions(mapping):
+    '''按 mapping 替換模塊載入時已取得的函數引用
+
+    查詢表的生成函數和 HTTP 路由表在導入時就保存了函數本身，只替換
+    模塊屬性不會影響它們
+
+    @param dict mapping { 原函數: 新函數 }
+    '''
+    for table in LAZY_TABLES:
+        table.build = mapping.get(table.build, table.build)
+    for path, function in list(SERVE_ROUTES.items()):
+        SERVE_ROUTES[path] = mapping.get(function, function)
+
+
+def enable_stats():
+    '''開始統計本模塊各公開函數的調用次數和耗時
+
+    將模塊中的函數替換為計時包裝，未啟用時沒有任何額外開銷；
+    耗時包含被調用函數內部的其他調用。生成器函數每次調用計一次，
+    耗時為迭代過程中在生成器內部花費的時間之和（不含使用者在兩次
+    取值之間的時間），在迭代結束或生成器關閉時記錄
+    '''
+    import functools
+    import inspect
+    import random
+    import types
+    if STATS_ORIGINALS:
+        return
+    module = sys.modules[__name__]
+
+    def wrap(name, function):
+        record = STATS.setdefault(name, {
+            'calls': 0,
+            'total': 0.0,
+            'samples': array('d')
+        })
+        samples = record['samples']
+        perf_counter = time.perf_counter
+
+        def add_sample(elapsed):
+            record['calls'] += 1
+            record['total'] += elapsed
+            if len(samples) < STATS_SAMPLE_LIMIT:
+                samples.append(elapsed)
+            else:
+                i = random.randrange(record['calls'])
+                if i < STATS_SAMPLE_LIMIT:
+                    samples[i] = elapsed
+
+        if inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                elapsed = 0.0
+                iterator = function(*args, **kwargs)
+                try:
+                    while True:
+                        start = perf_counter()
+                        try:
+                            value = next(iterator)
+                        except StopIteration:
+                            return
+                        finally:
+                            elapsed += perf_counter() - start
+                        yield value
+                finally:
+                    iterator.close()
+                    add_sample(elapsed)
+            return generator_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                add_sample(perf_counter() - start)
+        return wrapper
+
+    for name, value in list(vars(module).items()):
+        if (isinstance(value, types.FunctionType)
+                and value.__module__ == __name__
+                and not name.startswith('_')
+                and name not in STATS_EXCLUDE):
+            STATS_ORIGINALS[name] = value
+            setattr(module, name, wrap(name, value))
+    rebind_stats_functions(dict(
+        (function, getattr(module, name))
+        for name, function in STATS_ORIGINALS.items()
+    ))
+
+
+def disable_stats():
+    '''停止統計並恢復原函數（已收集的數據保留至 reset_stats）'''
+    module = sys.modules[__name__]
+    rebind_stats_functions(dict(
+        (getattr(module, name), function)
+        for name, function in STATS_ORIGINALS.items()
+    ))
+    for name, function in STATS_ORIGINALS.items():
+        setattr(module, name, function)
+    STATS_ORIGINALS.clear()
+
+
+def reset_stats():
+    '''清空已收集的函數和緩存統計'''
+    for record in STATS.values():
+        record['calls'] = 0
+        record['total'] = 0.0
+        del record['samples'][:]
+    for cache in CACHES.values():
+        cache.hits = 0
+        cache.misses = 0
+
+
+def get_stats():
+    '''返回統計數據（時間單位為秒）
+
+    @return dict {
+        functions: dict { name: dict { calls, total, mean, p50, p90, p99,
+            max } } 只含被調用過的函數,
+        caches: dict { name: LRUCache.info() },
+        tables: dict { name: float 載入耗時，未載入為 None },
+        data_source: str
+    }
+    '''
+    functions = {}
+    for name, record in STATS.items():
+        if not record['calls']:
+            continue
+        samples = sorted(record['samples'])
+        functions[name] = {
+            'calls': record['calls'],
+            'total': record['total'],
+            'mean': record['total'] / record['calls'],
+            'p50': get_percentile(samples, 0.5),
+            'p90': get_percentile(samples, 0.9),
+            'p99': get_percentile(samples, 0.99),
+            'max': samples[-1]
+        }
+    return {
+        'functions': functions,
+        'caches': dict((name, cache.info()) for name, cache in CACHES.items()),
+        'tables': dict((table.name, table.load_time) for table in LAZY_TABLES),
+        'data_source': DATA_SOURCE
+    }
+
+
+def print_stats(file=None):
+    '''輸出統計摘要（默認輸出到 stderr）
+
+    @param file file
+    '''
+    file = file or sys.stderr
+    stats = get_stats()
+    print('{0:<28}{1:>10}{2:>12}{3:>10}{4:>10}{5:>10}{6:>10}'.format(
+        'function', 'calls', 'total ms', 'mean us', 'p50 us', 'p90 us',
+        'p99 us'
+    ), file=file)
+    for name, record in sorted(stats['functions'].items(),
+                               key=lambda item: -item[1]['total']):
+        print('{0:<28}{1:>10}{2:>12.3f}{3:>10.2f}{4:>10.2f}{5:>10.2f}'
+              '{6:>10.2f}'.format(
+                  name, record['calls'], record['total'] * 1e3,
+                  record['mean'] * 1e6, record['p50'] * 1e6,
+                  record['p90'] * 1e6, record['p99'] * 1e6
+              ), file=file)
+    for name, info in stats['caches'].items():
+        print('cache {0}: {1} hits, {2} misses, {3}/{4} entries'.format(
+            name, info['hits'], info['misses'], info['currsize'],
+            info['maxsize']
+        ), file=file)
+    for name, load_time in stats['tables'].items():
+        if load_time is not None:
+            print('table {0}: {1:.2f} ms'.format(name, load_time * 1000),
+                  file=file)
+    print('data source: {0}'.format(stats['data_source'] or 'none'),
+          file=file)
+
+
+def print_startup_profile(first_call_time):
+    '''向 stderr 輸出導入耗時、首次調用耗時及各查詢表的載入耗時
+
+    @param float first_call_time 秒
+    '''
+    print('import: {0:.2f} ms'.format(IMPORT_TIME * 1000), file=sys.stderr)
+    print('first call: {0:.2f} ms'.format(first_call_time * 1000),
+          file=sys.stderr)
+    print('data source: {0}'.format(DATA_SOURCE or 'none'), file=sys.stderr)
+    for table in LAZY_TABLES:
+        if table.loaded:
+            print('table {0}: {1:.2f} ms'.format(
+                table.name, table.load_time * 1000
+            ), file=sys.stderr)
 
 
 def main():
+    import argparse
     parser = argparse.ArgumentParser(
         description=
         'Chinese Calendar Toolkit (All the time involved is UTC+8 time)'
     )
+    parser.add_argument('--startup-profile', action='store_true',
+                        help='Report import, first call and table load '
+                             'times to stderr')
+    parser.add_argument('--stats', action='store_true',
+                        help='Print call counts, latencies, cache and table '
+                             'statistics to stderr on exit')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='Write cProfile data to FILE (see pstats)')
     subparsers = parser.add_subparsers()
 
     cal = subparsers.add_parser('calendar', help='Print calendar of a month')
@@ -671,7 +4760,10 @@ def main():
     full.add_argument('year', type=int)
     full.add_argument('-f', type=int, default=0, metavar='first_weekday',
                       help='The first weekday (0=Monday)')
-    full.set_defaults(func=lambda args: print_full_year(args.year, args.f))
+    full.add_argument('-c', type=int, default=1, metavar='columns',
+                      help='Number of months printed side by side')
+    full.set_defaults(func=lambda args: print_full_year(args.year, args.f,
+                                                        args.c))
 
     festival = subparsers.add_parser('festivals',
                                      help='Print gregorian date of festivals')
@@ -689,14 +4781,122 @@ def main():
     info.set_defaults(func=print_info)
 
     now = subparsers.add_parser('now', help='Print information of now')
+    now.add_argument('-w', '--watch', action='store_true',
+                     help='Keep running and update the changed fields at '
+                          'each quarter (刻) boundary')
     now.set_defaults(func=print_now)
 
+    convert = subparsers.add_parser('convert',
+        help='Convert dates or datetimes (one per line) to lunar date, '
+             'zodiac and the Four Pillars'
+    )
+    convert.add_argument('file', nargs='?', default='-',
+                         help='Input file (default: stdin)')
+    convert.add_argument('--format', choices=['jsonl', 'csv'],
+                         default='jsonl', help='Output format')
+    convert.add_argument('-j', '--workers', type=int, default=1,
+                         help='Number of worker processes')
+    convert.set_defaults(func=print_convert)
+
+    ics = subparsers.add_parser('ics',
+        help='Export lunar dates, solar terms and festivals as iCalendar'
+    )
+    ics.add_argument('start', help='First year (YYYY) or date (YYYY-MM-DD)')
+    ics.add_argument('end', nargs='?',
+                     help='Last year or date, inclusive (default: start)')
+    ics.add_argument('-o', '--output', help='Output file (default: stdout)')
+    ics.add_argument('--no-lunar', action='store_true',
+                     help='Omit the daily lunar date events')
+    ics.add_argument('--no-terms', action='store_true',
+                     help='Omit the solar term events')
+    ics.add_argument('--no-festivals', action='store_true',
+                     help='Omit the festival events')
+    ics.set_defaults(func=print_ics)
+
+    export = subparsers.add_parser('export',
+        help='Export lunar date, zodiac, pillars, solar terms and festivals '
+             'of every day'
+    )
+    export.add_argument('-o', '--output', help='Output file (default: stdout)')
+    export.add_argument('--format', choices=['csv', 'binary'], default='csv',
+                        help='Output format (binary: columnar, see '
+                             'load_export)')
+    export.add_argument('--start', type=int, default=1901,
+                        help='First year (default: %(default)s)')
+    export.add_argument('--end', type=int, default=2049,
+                        help='Last year (default: %(default)s)')
+    export.add_argument('-j', '--workers', type=int, default=os.cpu_count(),
+                        help='Number of worker processes '
+                             '(default: %(default)s)')
+    export.add_argument('-q', '--quiet', action='store_true',
+                        help='Do not report progress')
+    export.set_defaults(func=print_export)
+
+    search = subparsers.add_parser('search',
+        help='Find dates or hours whose Four Pillars match a pattern'
+    )
+    search.add_argument('start', help='First year (YYYY) or date (YYYY-MM-DD)')
+    search.add_argument('end', nargs='?',
+                        help='Last year or date, inclusive (default: start)')
+    search.add_argument('-y', metavar='pillar', help='Year pillar, e.g. 庚午')
+    search.add_argument('-m', metavar='pillar', help='Month pillar')
+    search.add_argument('-d', metavar='pillar', help='Day pillar')
+    search.add_argument('-H', metavar='pillar', help='Hour pillar')
+    search.set_defaults(func=print_search)
+
+    server = subparsers.add_parser('serve',
+        help='Run an HTTP/JSON conversion service'
+    )
+    server.add_argument('--host', default='127.0.0.1',
+                        help='Listen address (default: %(default)s)')
+    server.add_argument('-p', '--port', type=int, default=8080,
+                        help='Listen port (default: %(default)s)')
+    server.set_defaults(func=lambda args: serve(args.host, args.port))
+
+    verifier = subparsers.add_parser('verify',
+        help='Check the lookup tables and fast paths against the reference '
+             'algorithms for every day and hour'
+    )
+    verifier.add_argument('--start', type=int, default=1901,
+                          help='First year (default: %(default)s)')
+    verifier.add_argument('--end', type=int, default=2049,
+                          help='Last year (default: %(default)s)')
+    verifier.set_defaults(func=print_verify)
+
+    build_data = subparsers.add_parser('build-data',
+        help='Write the expanded lookup tables to a memory-mappable file'
+    )
+    build_data.add_argument('-o', '--output', default=DATA_FILE,
+                            help='Output path (default: %(default)s)')
+    build_data.set_defaults(func=lambda args: write_data_file(args.output))
+
     args = parser.parse_args()
-    if hasattr(args, 'func'):
-        args.func(args)
-    else:
-        datetime_now = datetime.datetime.now(tz)
-        print_calendar(datetime_now.year, datetime_now.month, 0)
+    if args.stats:
+        enable_stats()
+    if args.profile:
+        import cProfile
+        profile = cProfile.Profile()
+        profile.enable()
+    start = time.perf_counter()
+    try:
+        if hasattr(args, 'func'):
+            args.func(args)
+        else:
+            datetime_now = datetime.datetime.now(tz)
+            print_calendar(datetime_now.year, datetime_now.month, 0)
+    finally:
+        if args.profile:
+            profile.disable()
+            profile.dump_stats(args.profile)
+        if args.startup_profile or args.stats:
+            sys.stdout.flush()
+        if args.startup_profile:
+            print_startup_profile(time.perf_counter() - start)
+        if args.stats:
+            print_stats()
+
+
+IMPORT_TIME = time.perf_counter() - IMPORT_START
 
 
 if __name__ == '__main__':